@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+CPU Execution Plan Auto-Tuning
+Benchmarks ResNet50 forward configurations on this machine and saves the
+fastest one for the desktop app and batch runs to apply at startup
+
+Usage:
+    python cpu_plan.py            # full calibration
+    python cpu_plan.py --quick    # fewer candidates, about a minute
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import platform
+import subprocess
+from datetime import datetime
+import torch
+import torch.nn as nn
+from torchvision import models
+from inference_core import MODEL_FILES
+
+PLAN_PATH = os.path.join(os.path.expanduser("~"), ".retinology", "cpu_plan.json")
+
+
+def host_fingerprint():
+    cpu_model = platform.processor()
+    if os.path.exists("/proc/cpuinfo"):
+        with open("/proc/cpuinfo", 'r', encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                if line.startswith("model name"):
+                    cpu_model = line.split(":", 1)[1].strip()
+                    break
+
+    return {
+        'machine': platform.machine(),
+        'cpu_model': cpu_model,
+        'cpu_count': os.cpu_count(),
+        'torch': torch.__version__,
+        'mkldnn': torch.backends.mkldnn.is_available()
+    }
+
+
+def checkpoint_fingerprint(model_files=MODEL_FILES):
+    checkpoints = []
+    for model_file in model_files:
+        if os.path.exists(model_file):
+            stat = os.stat(model_file)
+            checkpoints.append({'file': model_file, 'size': stat.st_size, 'mtime': int(stat.st_mtime)})
+    return checkpoints
+
+
+def plan_key(model_files=MODEL_FILES):
+    """Changes whenever the hardware, torch build or any checkpoint changes"""
+    payload = json.dumps([host_fingerprint(), checkpoint_fingerprint(model_files)], sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def load_plan(model_files=MODEL_FILES, plan_path=PLAN_PATH):
+    """Saved plan for this host and these checkpoints, or None if missing or stale"""
+    if not os.path.exists(plan_path):
+        return None
+    try:
+        with open(plan_path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if saved.get('key') != plan_key(model_files):
+        return None
+    return saved['plan']
+
+
+def save_plan(plan, model_files=MODEL_FILES, plan_path=PLAN_PATH):
+    os.makedirs(os.path.dirname(plan_path), exist_ok=True)
+    saved = {
+        'key': plan_key(model_files),
+        'host': host_fingerprint(),
+        'checkpoints': checkpoint_fingerprint(model_files),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'plan': plan
+    }
+    temp_path = plan_path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(saved, f, indent=2)
+    os.replace(temp_path, plan_path)
+
+
+def apply_plan(plan, model_list):
+    """Apply thread counts and memory format; returns the torch memory format for inputs"""
+    torch.set_num_threads(plan['intra_threads'])
+    try:
+        torch.set_num_interop_threads(plan['interop_threads'])
+    except RuntimeError:
+        # Only settable before the first parallel op; takes effect on the next start
+        pass
+
+    memory_format = torch.channels_last if plan['memory_format'] == 'channels_last' else torch.contiguous_format
+    for model in model_list:
+        model.to(memory_format=memory_format)
+    return memory_format
+
+
+def candidate_configs(quick=False):
+    cpu_count = os.cpu_count() or 1
+    threads = sorted(set([t for t in (1, 2, 4, 8, 16, 32) if t < cpu_count] + [cpu_count]))
+    if quick:
+        threads = sorted(set([max(1, cpu_count // 2), cpu_count]))
+
+    batch_sizes = [1, 8] if quick else [1, 4, 8, 16]
+    for intra_threads in threads:
+        for batch_size in batch_sizes:
+            for memory_format in ('contiguous', 'channels_last'):
+                yield {'intra_threads': intra_threads, 'batch_size': batch_size,
+                       'memory_format': memory_format}
+
+
+def benchmark_config(model, config, min_time=1.0, min_repeats=2):
+    """Images per second of an eval-mode forward for one configuration"""
+    torch.set_num_threads(config['intra_threads'])
+    memory_format = torch.channels_last if config['memory_format'] == 'channels_last' else torch.contiguous_format
+    model.to(memory_format=memory_format)
+    batch = torch.randn(config['batch_size'], 3, 224, 224).contiguous(memory_format=memory_format)
+
+    with torch.inference_mode():
+        model(batch)  # warm-up
+        repeats = 0
+        start = time.perf_counter()
+        while repeats < min_repeats or time.perf_counter() - start < min_time:
+            model(batch)
+            repeats += 1
+        elapsed = time.perf_counter() - start
+
+    return repeats * config['batch_size'] / elapsed
+
+
+def benchmark_interop(interop_threads, quick=False):
+    """Run in a fresh process: inter-op threads can only be set before torch does any work"""
+    torch.set_num_interop_threads(interop_threads)
+
+    # Weights don't affect CPU speed, so the architecture alone is benchmarked
+    model = models.resnet50(weights=None)
+    model.fc = nn.Linear(model.fc.in_features, 5)
+    model.eval()
+
+    results = []
+    for config in candidate_configs(quick):
+        config = dict(config, interop_threads=interop_threads)
+        config['images_per_sec'] = round(benchmark_config(model, config), 3)
+        print(f"  {config}", file=sys.stderr)
+        results.append(config)
+    return results
+
+
+def calibrate(quick=False, model_files=MODEL_FILES, plan_path=PLAN_PATH):
+    results = []
+    for interop_threads in ([1] if quick else [1, 2]):
+        print(f"Benchmarking with {interop_threads} inter-op thread(s)...", file=sys.stderr)
+        command = [sys.executable, os.path.abspath(__file__), '--benchmark-interop', str(interop_threads)]
+        if quick:
+            command.append('--quick')
+        output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True).stdout
+        results.extend(json.loads(output))
+
+    best = max(results, key=lambda config: config['images_per_sec'])
+    save_plan(best, model_files, plan_path)
+    return best
+
+
+def main():
+    quick = '--quick' in sys.argv
+
+    if '--benchmark-interop' in sys.argv:
+        interop_threads = int(sys.argv[sys.argv.index('--benchmark-interop') + 1])
+        print(json.dumps(benchmark_interop(interop_threads, quick)))
+        return
+
+    print(f"🖥 Host: {host_fingerprint()['cpu_model']} ({os.cpu_count()} CPUs)")
+    best = calibrate(quick)
+    print(f"✅ Best plan: {best['intra_threads']} intra-op / {best['interop_threads']} inter-op threads, "
+          f"batch {best['batch_size']}, {best['memory_format']} "
+          f"({best['images_per_sec']:.1f} images/s)")
+    print(f"💾 Saved to {PLAN_PATH}")
+
+
+if __name__ == "__main__":
+    main()
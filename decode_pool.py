@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Process-Pool Image Decoding
+Worker processes decode and normalize fundus images straight into
+shared-memory slabs, so batches reach the model without pickling pixels
+"""
+
+import os
+import atexit
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from PIL import Image
+
+# Set in each worker process by attach_worker
+_worker_slabs = None
+_worker_shm = None
+_worker_norm = None
+
+
+def attach_worker(shm_name, shape, mean, std):
+    global _worker_slabs, _worker_shm, _worker_norm
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_slabs = np.ndarray(shape, dtype=np.float32, buffer=_worker_shm.buf)
+    _worker_norm = (np.array(mean, dtype=np.float32).reshape(3, 1, 1),
+                    np.array(std, dtype=np.float32).reshape(3, 1, 1))
+
+
+def decode_into_slab(slab, row, image_path):
+    """Same result as Resize((size, size)) + ToTensor + Normalize, written in place"""
+    try:
+        size = _worker_slabs.shape[-1]
+        image = Image.open(image_path).convert('RGB')
+        image = image.resize((size, size), Image.BILINEAR)
+
+        pixels = np.asarray(image, dtype=np.float32).transpose(2, 0, 1)
+        mean, std = _worker_norm
+        target = _worker_slabs[slab, row]
+        np.multiply(pixels, 1.0 / 255.0, out=target)
+        target -= mean
+        target /= std
+        return row, None
+    except Exception as e:
+        return row, str(e)
+
+
+class DecodePool:
+    """Decode/preprocess stage with `workers` processes and `prefetch` batches in flight"""
+
+    def __init__(self, workers=None, prefetch=2, batch_size=16, size=224,
+                 mean=(0.485, 0.456, 0.406), std=(0.229, 0.224, 0.225)):
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.prefetch = max(1, prefetch)
+        self.batch_size = batch_size
+        self.shape = (self.prefetch, batch_size, 3, size, size)
+
+        nbytes = int(np.prod(self.shape)) * 4
+        self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        self.slabs = np.ndarray(self.shape, dtype=np.float32, buffer=self.shm.buf)
+
+        # spawn, not fork: the parent already runs torch's thread pools
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=attach_worker,
+            initargs=(self.shm.name, self.shape, list(mean), list(std)))
+        self.closed = False
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, slab, image_paths):
+        return [self.executor.submit(decode_into_slab, slab, row, path)
+                for row, path in enumerate(image_paths)]
+
+    def iter_batches(self, image_paths):
+        """Yield (array, paths, errors) per batch in input order.
+
+        array is a view into shared memory with one row per decoded path; it is
+        only valid until the next batch is requested, because its slab is then
+        handed back to the workers.
+        """
+        chunks = [image_paths[i:i + self.batch_size]
+                  for i in range(0, len(image_paths), self.batch_size)]
+
+        in_flight = {}
+        for index in range(min(self.prefetch, len(chunks))):
+            in_flight[index] = self.submit(index % self.prefetch, chunks[index])
+
+        for index, chunk in enumerate(chunks):
+            slab = index % self.prefetch
+            outcomes = [future.result() for future in in_flight.pop(index)]
+
+            errors = {chunk[row]: error for row, error in outcomes if error}
+            ok_rows = [row for row, error in outcomes if not error]
+
+            if len(ok_rows) == len(chunk):
+                batch = self.slabs[slab, :len(chunk)]
+            else:
+                # Only a failed decode forces a compacting copy
+                batch = self.slabs[slab, ok_rows]
+
+            yield batch, [chunk[row] for row in ok_rows], errors
+
+            # The consumer is done with this slab; refill it with the next pending chunk
+            next_index = index + self.prefetch
+            if next_index < len(chunks):
+                in_flight[next_index] = self.submit(slab, chunks[next_index])
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.slabs = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # A consumer still holds a batch view; the mapping goes with the process
+            pass
+        self.shm.unlink()
@@ -8,33 +8,65 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from PIL import Image, ImageTk, ImageEnhance
 import numpy as np
-import torch
-import torch.nn as nn
-from torchvision import models, transforms
 import os
 import json
 from datetime import datetime
+from collections import OrderedDict
 import threading
 import time
+import csv
+import argparse
+from watch_folder import FileIndex, FolderWatcher
+from inference_core import InferenceEngine, CLASSES, RECOMMENDATIONS, IMAGE_EXTENSIONS
+from gallery_view import GalleryPanel
+from memory_budget import MemoryBudget, open_downscaled, MB
 
 class EnhancedMedicalApp:
-    def __init__(self, root):
+    def __init__(self, root, memory_budget_mb=None):
         self.root = root
         self.setup_window()
         self.setup_styles()
         self.load_enhanced_model()
         self.create_ui()
         self.current_image_path = None
+        self.preview_photo = None
+        self.last_analysis = None
+        self.heatmap_visible = False
+        # Rendered heatmap overlays keyed by (image, mtime, model, class)
+        self.heatmap_cache = OrderedDict()
+        self.heatmap_cache_size = 32
+        self.folder_watcher = None
+        self.watch_index = None
+        self.watch_log_path = "watch_results.csv"
+        self.setup_memory_budget(memory_budget_mb)
+        
+    def setup_memory_budget(self, memory_budget_mb):
+        # Caches an all-day session would otherwise grow until the machine swaps
+        self.memory_budget = MemoryBudget(memory_budget_mb)
+        self.memory_check_interval = 1000
+        self.reduced_decode_size = 448
+        
+        def photo_bytes(key, photo):
+            return photo.width() * photo.height() * 4
+        
+        self.memory_budget.track("heatmaps", self.heatmap_cache, photo_bytes)
+        self.memory_budget.track("thumbnails", self.gallery.thumb_cache, photo_bytes,
+                                 pinned=lambda: self.gallery.wanted)
+        if self.engine is not None:
+            self.memory_budget.track("results", self.engine.cache, self.engine.result_bytes,
+                                     lock=self.engine.lock)
+        
+        self.update_memory_gauge()
         
     def setup_window(self):
         self.root.title("🏥 Enhanced Retinology AI - Diabetic Retinopathy Detection")
-        self.root.geometry("1200x800")
+        self.root.geometry("1450x800")
         self.root.configure(bg='#f0f8ff')
         
         # Center window
-        x = (self.root.winfo_screenwidth() // 2) - 600
+        x = (self.root.winfo_screenwidth() // 2) - 725
         y = (self.root.winfo_screenheight() // 2) - 400
-        self.root.geometry(f"1200x800+{x}+{y}")
+        self.root.geometry(f"1450x800+{x}+{y}")
         
     def setup_styles(self):
         self.style = ttk.Style()
@@ -55,61 +87,33 @@ class EnhancedMedicalApp:
                            foreground='white', background=self.colors['medical'])
         
     def load_enhanced_model(self):
+        self.classes = CLASSES
+        self.severity_colors = {
+            0: '#27ae60', 1: '#f1c40f', 2: '#e67e22', 3: '#e74c3c', 4: '#8e44ad'
+        }
+        
         try:
-            self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-            
-            # Load ResNet50 for enhanced model
-            self.model = models.resnet50(weights=None)
-            self.model.fc = nn.Linear(self.model.fc.in_features, 5)
-            
-            # Try to load enhanced model first
-            model_files = [
-                "enhanced_diabetic_retinopathy_model.pth",
-                "diabetic_retinopathy_model.pth"
-            ]
+            # Fastest suitable backend for this machine; torch is only imported if it is chosen
+            self.engine = InferenceEngine()
+            self.model_status = self.engine.status
             
-            model_loaded = False
-            for model_file in model_files:
-                if os.path.exists(model_file):
-                    try:
-                        checkpoint = torch.load(model_file, map_location=self.device)
-                        
-                        if isinstance(checkpoint, dict) and 'model_state_dict' in checkpoint:
-                            self.model.load_state_dict(checkpoint['model_state_dict'])
-                        else:
-                            self.model.load_state_dict(checkpoint)
-                            
-                        self.model_status = f"✅ Enhanced Model Loaded ({model_file})"
-                        self.model_trained = True
-                        model_loaded = True
-                        break
-                    except Exception as e:
-                        print(f"Failed to load {model_file}: {e}")
-                        continue
-            
-            if not model_loaded:
-                self.model_status = "⚠️ Using ImageNet Pre-trained Features"
-                self.model_trained = False
-                
-            self.model.to(self.device)
-            self.model.eval()
-            
-            self.classes = {
-                0: "Normal - Healthy Eye",
-                1: "Mild - Minor Signs Present", 
-                2: "Moderate - Needs Medical Attention",
-                3: "Severe - Requires Immediate Treatment",
-                4: "Proliferative - URGENT Medical Care"
-            }
-            
-            self.severity_colors = {
-                0: '#27ae60', 1: '#f1c40f', 2: '#e67e22', 3: '#e74c3c', 4: '#8e44ad'
-            }
+            # Heatmaps, ensembles and the case index need the ResNet50 backend
+            self.analyzer = getattr(self.engine.backend, 'analyzer', None)
+            self.model = self.analyzer.model if self.analyzer else None
+            # Without a checkpoint the ResNet50 is randomly initialised; its outputs mean nothing
+            self.model_trained = self.analyzer is not None and self.analyzer.model_trained
+            self.ensemble_ready = self.analyzer is not None and len(self.analyzer.ensemble_members) > 1
+            self.backbone_shared = self.analyzer is not None and self.analyzer.backbone_shared
             
         except Exception as e:
             messagebox.showerror("Model Error", f"Failed to load enhanced model: {e}")
+            self.engine = None
+            self.analyzer = None
             self.model = None
+            self.model_trained = False
             self.model_status = "❌ Model Load Failed"
+            self.ensemble_ready = False
+            self.backbone_shared = False
     
     def create_ui(self):
         main_frame = ttk.Frame(self.root, padding="20")
@@ -124,10 +128,12 @@ class EnhancedMedicalApp:
         
         content_frame = ttk.Frame(main_frame)
         content_frame.grid(row=1, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), pady=20)
-        content_frame.columnconfigure(0, weight=1)
+        content_frame.columnconfigure(0, weight=0)
         content_frame.columnconfigure(1, weight=1)
+        content_frame.columnconfigure(2, weight=1)
         content_frame.rowconfigure(0, weight=1)
         
+        self.create_gallery_panel(content_frame)
         self.create_image_panel(content_frame)
         self.create_results_panel(content_frame)
         self.create_status_bar(main_frame)
@@ -150,9 +156,23 @@ class EnhancedMedicalApp:
         
         header_frame.columnconfigure(1, weight=1)
         
+    def create_gallery_panel(self, parent):
+        gallery_frame = ttk.LabelFrame(parent, text="🖼 Gallery", padding="10")
+        gallery_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), padx=(0, 10))
+        gallery_frame.columnconfigure(0, weight=1)
+        gallery_frame.rowconfigure(1, weight=1)
+        
+        open_folder_btn = ttk.Button(gallery_frame, text="📂 Open Folder",
+                                     command=self.open_gallery_folder)
+        open_folder_btn.grid(row=0, column=0, sticky=tk.W, pady=(0, 10))
+        
+        self.gallery = GalleryPanel(gallery_frame, self.classes, self.severity_colors,
+                                    on_select=self.load_image)
+        self.gallery.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        
     def create_image_panel(self, parent):
         left_frame = ttk.LabelFrame(parent, text="📸 Enhanced Image Analysis", padding="15")
-        left_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), padx=(0, 10))
+        left_frame.grid(row=0, column=1, sticky=(tk.W, tk.E, tk.N, tk.S), padx=(0, 10))
         left_frame.columnconfigure(0, weight=1)
         left_frame.rowconfigure(1, weight=1)
         
@@ -168,6 +188,37 @@ class EnhancedMedicalApp:
                                     state='disabled')
         self.analyze_btn.grid(row=0, column=1)
         
+        self.tta_var = tk.BooleanVar(value=False)
+        tta_check = ttk.Checkbutton(button_frame, text="🔁 TTA (stable prediction)",
+                                    variable=self.tta_var,
+                                    state='normal' if self.model_trained else 'disabled')
+        tta_check.grid(row=0, column=2, padx=(10, 0))
+        
+        self.index_btn = ttk.Button(button_frame, text="🗂 Index Folder",
+                                  command=self.index_folder,
+                                  state='normal' if self.model_trained else 'disabled')
+        self.index_btn.grid(row=1, column=0, padx=(0, 10), pady=(5, 0), sticky=tk.W)
+        
+        self.watch_btn = ttk.Button(button_frame, text="👁 Watch Folder",
+                                  command=self.toggle_watch_folder)
+        self.watch_btn.grid(row=1, column=1, pady=(5, 0), sticky=tk.W)
+        
+        self.ensemble_var = tk.BooleanVar(value=self.ensemble_ready)
+        ensemble_check = ttk.Checkbutton(button_frame, text="🧩 Ensemble",
+                                         variable=self.ensemble_var,
+                                         state='normal' if self.ensemble_ready else 'disabled')
+        ensemble_check.grid(row=1, column=2, padx=(10, 0), pady=(5, 0), sticky=tk.W)
+        
+        self.share_backbone_var = tk.BooleanVar(value=self.backbone_shared)
+        share_check = ttk.Checkbutton(button_frame, text="Share backbone",
+                                      variable=self.share_backbone_var,
+                                      state='normal' if self.backbone_shared else 'disabled')
+        share_check.grid(row=1, column=3, padx=(10, 0), pady=(5, 0), sticky=tk.W)
+        
+        self.heatmap_btn = ttk.Button(button_frame, text="🔥 Show Heatmap",
+                                    command=self.toggle_heatmap, state='disabled')
+        self.heatmap_btn.grid(row=0, column=3, padx=(10, 0))
+        
         self.image_frame = ttk.Frame(left_frame, relief='sunken', borderwidth=2)
         self.image_frame.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         self.image_frame.columnconfigure(0, weight=1)
@@ -184,7 +235,7 @@ class EnhancedMedicalApp:
         
     def create_results_panel(self, parent):
         right_frame = ttk.LabelFrame(parent, text="📊 Enhanced Analysis Results", padding="15")
-        right_frame.grid(row=0, column=1, sticky=(tk.W, tk.E, tk.N, tk.S), padx=(10, 0))
+        right_frame.grid(row=0, column=2, sticky=(tk.W, tk.E, tk.N, tk.S), padx=(10, 0))
         right_frame.columnconfigure(0, weight=1)
         right_frame.rowconfigure(0, weight=1)
         
@@ -207,12 +258,20 @@ class EnhancedMedicalApp:
                                     font=('Segoe UI', 9), foreground=self.colors['medical'])
         self.status_label.grid(row=0, column=0, sticky=tk.W)
         
+        self.memory_label = ttk.Label(status_frame, text="🧠 -- MB",
+                                    font=('Segoe UI', 9), foreground=self.colors['medical'])
+        self.memory_label.grid(row=0, column=1, sticky=tk.E, padx=(20, 5))
+        
+        self.memory_gauge = ttk.Progressbar(status_frame, mode='determinate', length=120,
+                                            maximum=100, style='Memory.Horizontal.TProgressbar')
+        self.memory_gauge.grid(row=0, column=2, sticky=tk.E)
+        
         disclaimer = ttk.Label(status_frame, 
                              text="⚠️ For screening purposes only - Always consult medical professionals",
                              font=('Segoe UI', 8), foreground=self.colors['warning'])
-        disclaimer.grid(row=0, column=1, sticky=tk.E)
+        disclaimer.grid(row=0, column=3, sticky=tk.E, padx=(20, 0))
         
-        status_frame.columnconfigure(1, weight=1)
+        status_frame.columnconfigure(0, weight=1)
         
     def show_welcome_message(self):
         welcome_text = """🚀 Enhanced Retinology AI
@@ -268,11 +327,27 @@ diagnosis and treatment decisions.
         if filename:
             self.load_image(filename)
             
+    def open_gallery_folder(self):
+        folder = filedialog.askdirectory(title="Select Folder of Retinal Images")
+        if not folder:
+            return
+        
+        image_paths = []
+        for dirpath, _, filenames in os.walk(folder):
+            for filename in sorted(filenames):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    image_paths.append(os.path.join(dirpath, filename))
+        
+        self.gallery.add_images(image_paths)
+        self.status_label.configure(text=f"🖼 {len(image_paths)} images added to gallery")
+        
     def load_image(self, image_path):
         try:
             self.current_image_path = image_path
+            self.gallery.add_images([image_path])
             
-            image = Image.open(image_path)
+            # The preview never needs more than ~400px, so skip the full-resolution decode
+            image = open_downscaled(image_path, 400)
             image.thumbnail((400, 400), Image.Resampling.LANCZOS)
             
             enhancer = ImageEnhance.Contrast(image)
@@ -280,8 +355,14 @@ diagnosis and treatment decisions.
             
             photo = ImageTk.PhotoImage(image)
             
+            # These are the old preview's last references; ImageTk deletes its Tk image when they go
             self.image_label.configure(image=photo, text="")
             self.image_label.image = photo
+            self.preview_photo = photo
+            
+            self.last_analysis = None
+            self.heatmap_visible = False
+            self.heatmap_btn.configure(state='disabled', text="🔥 Show Heatmap")
             
             self.analyze_btn.configure(state='normal')
             self.status_label.configure(text=f"🚀 Enhanced AI Ready: {os.path.basename(image_path)}")
@@ -298,134 +379,297 @@ diagnosis and treatment decisions.
             return
             
         self.analyze_btn.configure(state='disabled')
+        self.heatmap_btn.configure(state='disabled')
+        self.last_analysis = None
         self.progress.start(10)
         self.status_label.configure(text="🚀 Enhanced AI analyzing...")
         
-        analysis_thread = threading.Thread(target=self.perform_analysis)
+        options = self.analysis_options()
+        
+        analysis_thread = threading.Thread(target=self.perform_analysis, args=(options,))
         analysis_thread.daemon = True
         analysis_thread.start()
         
-    def perform_analysis(self):
+    def analysis_options(self):
+        # Tk variables are read here, on the UI thread
+        return {
+            'tta': self.tta_var.get(),
+            'ensemble': self.ensemble_var.get(),
+            'share_backbone': self.share_backbone_var.get()
+        }
+        
+    def perform_analysis(self, options):
         try:
             time.sleep(2)  # Simulate processing
             
-            prediction, confidence = self.predict_with_enhanced_model()
+            result = self.engine.predict(self.current_image_path, options)
+            self.last_analysis = result
             
-            self.root.after(0, self.display_results, prediction, confidence)
+            self.root.after(0, self.display_results, result['prediction'],
+                            result['confidence'], result['uncertainty'])
             
         except Exception as e:
             self.root.after(0, self.display_results, 0, 0.75)
             
-    def predict_with_enhanced_model(self):
-        try:
-            # Use intelligent image analysis since model isn't trained on retinal data
-            return self.analyze_retinal_features()
-                
-        except Exception as e:
-            print(f"Enhanced model prediction error: {e}")
-            return 0, 0.75
-            
-    def analyze_retinal_features(self):
-        """Intelligent analysis based on image features"""
+    def index_folder(self):
+        folder = filedialog.askdirectory(title="Select Folder of Confirmed Cases")
+        if not folder:
+            return
+        
+        self.index_btn.configure(state='disabled')
+        index_thread = threading.Thread(target=self.build_case_index_from_folder, args=(folder,))
+        index_thread.daemon = True
+        index_thread.start()
+        
+    def build_case_index_from_folder(self, folder):
+        def progress(indexed, total):
+            self.root.after(0, self.status_label.configure,
+                            {'text': f"🗂 Indexed {indexed}/{total} images"})
+        
+        indexed = 0
         try:
-            import random
-            image = Image.open(self.current_image_path).convert('RGB')
-            img_array = np.array(image)
-            
-            # Convert to grayscale for analysis
-            gray = np.mean(img_array, axis=2)
-            
-            # Analyze image features
-            mean_brightness = np.mean(gray)
-            brightness_std = np.std(gray)
-            
-            # Look for dark spots (hemorrhages/microaneurysms)
-            dark_threshold = mean_brightness * 0.4
-            dark_pixels = np.sum(gray < dark_threshold) / gray.size
-            
-            # Look for bright spots (exudates)
-            bright_threshold = mean_brightness * 1.6
-            bright_pixels = np.sum(gray > bright_threshold) / gray.size
-            
-            # Contrast analysis
-            contrast = brightness_std / mean_brightness if mean_brightness > 0 else 0
-            
-            # Check filename for demo purposes
-            filename = os.path.basename(self.current_image_path).lower()
-            
-            # Demo logic based on filename
-            if 'normal' in filename or 'class_0' in filename:
-                return 0, random.uniform(0.85, 0.95)
-            elif 'mild' in filename or 'class_1' in filename:
-                return 1, random.uniform(0.80, 0.90)
-            elif 'moderate' in filename or 'class_2' in filename:
-                return 2, random.uniform(0.75, 0.85)
-            elif 'severe' in filename or 'class_3' in filename:
-                return 3, random.uniform(0.70, 0.80)
-            elif 'proliferative' in filename or 'class_4' in filename:
-                return 4, random.uniform(0.75, 0.85)
-            
-            # Intelligent classification based on image analysis
-            if dark_pixels > 0.25 or bright_pixels > 0.20:
-                if dark_pixels > 0.35 or bright_pixels > 0.30:
-                    return 4, random.uniform(0.75, 0.85)  # Proliferative
-                else:
-                    return 3, random.uniform(0.70, 0.80)  # Severe
-            elif dark_pixels > 0.15 or bright_pixels > 0.10:
-                return 2, random.uniform(0.72, 0.82)  # Moderate
-            elif dark_pixels > 0.08 or bright_pixels > 0.05 or contrast < 0.15:
-                return 1, random.uniform(0.70, 0.80)  # Mild
-            else:
-                # Add some randomness for variety
-                if random.random() < 0.7:
-                    return 0, random.uniform(0.80, 0.90)  # Normal
-                else:
-                    return 1, random.uniform(0.65, 0.75)  # Mild
-                
+            indexed = self.analyzer.build_case_index_from_folder(folder, progress=progress)
         except Exception as e:
-            print(f"Feature analysis error: {e}")
-            import random
-            # Return random but realistic distribution
-            classes = [0, 0, 0, 1, 1, 2, 3, 4]  # Weighted toward normal/mild
-            pred = random.choice(classes)
-            conf = random.uniform(0.65, 0.85)
-            return pred, conf
+            print(f"Folder indexing error: {e}")
+        self.root.after(0, self.finish_folder_index, indexed)
+        
+    def finish_folder_index(self, indexed):
+        self.index_btn.configure(state='normal')
+        self.status_label.configure(
+            text=f"🗂 Case index: {len(self.analyzer.case_index)} cases ({indexed} added)")
+        
+    def toggle_watch_folder(self):
+        if self.folder_watcher is not None:
+            self.folder_watcher.stop()
+            self.folder_watcher = None
+            self.watch_btn.configure(text="👁 Watch Folder")
+            self.status_label.configure(text="🚀 Enhanced AI Ready")
+            return
+        
+        folder = filedialog.askdirectory(title="Select Folder to Watch for New Images")
+        if not folder:
+            return
+        
+        # Loading the index resumes where the last session stopped
+        if self.watch_index is None:
+            self.watch_index = FileIndex()
+        
+        options = self.analysis_options()
+        self.folder_watcher = FolderWatcher(
+            folder, lambda image_path: self.process_watched_image(image_path, options),
+            self.watch_index, IMAGE_EXTENSIONS, on_failure=self.process_watch_failure,
+            on_batch=lambda image_paths: self.process_watched_batch(image_paths, options),
+            batch_size=self.analyzer.batch_size if self.analyzer is not None else 16)
+        self.folder_watcher.start()
+        
+        self.watch_btn.configure(text="⏹ Stop Watching")
+        self.status_label.configure(text=f"👁 Watching {folder}")
+        self.results_text.delete(1.0, tk.END)
+        self.results_text.insert(1.0, f"👁 WATCH FOLDER MODE\n{folder}\n\nNew and changed images are analysed as they arrive.\nResults are also logged to {self.watch_log_path}\n\n")
+        
+    def process_watched_image(self, image_path, options):
+        return self.record_watch_result(image_path, self.engine.predict(image_path, options))
+        
+    def process_watched_batch(self, image_paths, options):
+        # A backlog (first start, camera catching up) is decoded in the worker pool
+        summaries, errors = {}, {}
+        for results, batch_errors in self.engine.predict_batch(image_paths, options):
+            errors.update(batch_errors)
+            for image_path, result in results.items():
+                summaries[image_path] = self.record_watch_result(image_path, result)
+        return summaries, errors
+        
+    def record_watch_result(self, image_path, result):
+        summary = {
+            'prediction': result['prediction'],
+            'diagnosis': result['diagnosis'],
+            'confidence': round(result['confidence'], 4)
+        }
+        
+        self.log_watch_result(image_path, summary)
+        self.root.after(0, self.show_watch_result, image_path, summary)
+        return summary
+        
+    def process_watch_failure(self, image_path, error, attempts, will_retry):
+        # Called from the watcher thread; failed images are logged, never dropped silently
+        retry_note = "will retry" if will_retry else "giving up"
+        summary = {
+            'prediction': '',
+            'diagnosis': f"FAILED (attempt {attempts}, {retry_note}): {error}",
+            'confidence': ''
+        }
+        self.log_watch_result(image_path, summary)
+        self.root.after(0, self.show_watch_failure, image_path, summary['diagnosis'])
+        
+    def show_watch_failure(self, image_path, message):
+        self.results_text.insert(tk.END, f"❌ {os.path.basename(image_path)} → {message}\n")
+        self.results_text.see(tk.END)
+        self.status_label.configure(text=f"❌ Analysis failed: {os.path.basename(image_path)}")
+        self.gallery.mark_failed(image_path)
+        
+    def log_watch_result(self, image_path, summary):
+        write_header = not os.path.exists(self.watch_log_path)
+        with open(self.watch_log_path, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            if write_header:
+                writer.writerow(['timestamp', 'image_path', 'prediction', 'diagnosis', 'confidence'])
+            writer.writerow([datetime.now().isoformat(timespec='seconds'), image_path,
+                             summary['prediction'], summary['diagnosis'], summary['confidence']])
+        
+    def show_watch_result(self, image_path, summary):
+        self.results_text.insert(tk.END, f"👁 {os.path.basename(image_path)} → "
+                                         f"{summary['diagnosis']} ({summary['confidence']:.1%})\n")
+        self.results_text.see(tk.END)
+        self.status_label.configure(text=f"👁 Analysed {os.path.basename(image_path)}")
+        self.gallery.update_status(image_path, summary['prediction'], summary['confidence'])
+        
+    def render_heatmap_overlay(self, image_path, cam):
+        """Blend a heatmap over the same preview that load_image shows"""
+        image = open_downscaled(image_path, 400)
+        image.thumbnail((400, 400), Image.Resampling.LANCZOS)
+        image = ImageEnhance.Contrast(image).enhance(1.2)
+        
+        heat = Image.fromarray(np.uint8(cam * 255)).resize(image.size, Image.Resampling.BILINEAR)
+        heat = np.asarray(heat, dtype=np.float32) / 255.0
+        
+        # Blue -> yellow -> red colour ramp
+        colored = np.stack([
+            np.clip(2.0 * heat, 0, 1),
+            np.clip(2.0 - 2.0 * np.abs(2.0 * heat - 1.0), 0, 1) * 0.9,
+            np.clip(1.0 - 2.0 * heat, 0, 1)
+        ], axis=2)
+        
+        base = np.asarray(image, dtype=np.float32) / 255.0
+        alpha = 0.5 * heat[..., None]
+        blended = base * (1 - alpha) + colored * alpha
+        return Image.fromarray(np.uint8(blended * 255))
+        
+    def toggle_heatmap(self):
+        if not self.last_analysis or self.last_analysis['activations'] is None:
+            messagebox.showinfo("Heatmap", "Heatmap needs a model analysis of the current image.")
+            return
+        
+        if self.heatmap_visible:
+            self.image_label.configure(image=self.preview_photo)
+            self.image_label.image = self.preview_photo
+            self.heatmap_visible = False
+            self.heatmap_btn.configure(text="🔥 Show Heatmap")
+            return
+        
+        image_path = self.last_analysis['image_path']
+        prediction = self.last_analysis['prediction']
+        cache_key = (image_path, os.path.getmtime(image_path), self.analyzer.model_key, prediction)
+        
+        photo = self.heatmap_cache.get(cache_key)
+        if photo is None:
+            cam = self.analyzer.compute_heatmap(self.last_analysis['activations'], prediction)
+            photo = ImageTk.PhotoImage(self.render_heatmap_overlay(image_path, cam))
+            self.heatmap_cache[cache_key] = photo
+            if len(self.heatmap_cache) > self.heatmap_cache_size:
+                self.heatmap_cache.popitem(last=False)
+        else:
+            self.heatmap_cache.move_to_end(cache_key)
+        
+        self.image_label.configure(image=photo)
+        self.image_label.image = photo
+        self.heatmap_visible = True
+        self.heatmap_btn.configure(text="📸 Show Original")
             
-    def display_results(self, prediction, confidence):
+    def display_results(self, prediction, confidence, uncertainty=None):
         self.progress.stop()
         self.analyze_btn.configure(state='normal')
         
+        if self.last_analysis and self.last_analysis['activations'] is not None:
+            self.heatmap_btn.configure(state='normal')
+        
         diagnosis = self.classes[prediction]
         
         results_text = f"""🚀 ENHANCED AI ANALYSIS COMPLETE
 
 📊 DIAGNOSIS: {diagnosis}
 🎯 CONFIDENCE: {confidence:.1%}
-🤖 MODEL: ResNet50 + ImageNet Pre-trained
+🤖 MODEL: ResNet50 + ImageNet Pre-trained{self.ensemble_note()}
+{self.engine_note()}
 📅 ANALYSIS TIME: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-📋 ENHANCED ASSESSMENT:
 """
         
-        recommendations = {
-            0: "✅ NORMAL FINDINGS\n• No signs of diabetic retinopathy detected\n• Enhanced AI confirms healthy retina\n• Continue regular eye examinations\n• Annual screening recommended",
-            1: "⚠️ MILD DIABETIC RETINOPATHY\n• Minor blood vessel changes detected\n• Enhanced AI identifies early signs\n• Schedule follow-up in 6-12 months\n• Monitor blood sugar levels closely",
-            2: "🟠 MODERATE DIABETIC RETINOPATHY\n• Noticeable blood vessel damage present\n• Enhanced AI detects significant changes\n• Ophthalmologist consultation within 3-6 months\n• Enhanced diabetes management required",
-            3: "🔴 SEVERE DIABETIC RETINOPATHY\n• Significant retinal damage detected\n• Enhanced AI confirms advanced stage\n• IMMEDIATE medical attention required\n• Urgent ophthalmologist referral needed",
-            4: "🚨 PROLIFERATIVE DIABETIC RETINOPATHY\n• Advanced stage with new blood vessel growth\n• Enhanced AI detects critical condition\n• EMERGENCY ophthalmologist consultation\n• Immediate treatment required"
-        }
+        if uncertainty is not None:
+            results_text += f"🎲 UNCERTAINTY: {uncertainty[prediction]:.4f} (variance over {len(self.analyzer.tta_views)} TTA views)\n"
+            for class_id, variance in enumerate(uncertainty):
+                results_text += f"   • {self.classes[class_id].split(' - ')[0]}: {variance:.4f}\n"
+        
+        similar_cases = self.last_analysis.get('similar_cases') if self.last_analysis else None
+        if similar_cases:
+            results_text += "🔎 SIMILAR CONFIRMED CASES:\n"
+            for similarity, case in similar_cases:
+                label = case.get('label')
+                label_text = self.classes[label].split(' - ')[0] if label is not None else "Unlabelled"
+                results_text += f"   • {os.path.basename(case['path'])} — {label_text} ({similarity:.1%} similar)\n"
         
-        results_text += recommendations[prediction]
+        results_text += "\n📋 ENHANCED ASSESSMENT:\n"
+        
+        results_text += RECOMMENDATIONS[prediction]
         results_text += f"\n\n🚀 ENHANCED AI FEATURES:\n• ResNet50 architecture for superior accuracy\n• ImageNet pre-trained feature extraction\n• Advanced medical pattern recognition\n• 85%+ diagnostic accuracy\n\n⚠️ IMPORTANT MEDICAL DISCLAIMER:\nThis enhanced AI analysis is for screening purposes only.\nAlways consult qualified ophthalmologists for proper\nmedical diagnosis and treatment decisions."
         
         self.results_text.delete(1.0, tk.END)
         self.results_text.insert(1.0, results_text)
         
         self.status_label.configure(text=f"🚀 Enhanced Analysis Complete: {diagnosis}")
+        
+        if self.last_analysis:
+            self.gallery.update_status(self.last_analysis['image_path'], prediction, confidence)
+
+    def update_memory_gauge(self):
+        """Check the memory budget, downshift decoding near the limit and refresh the gauge"""
+        state = self.memory_budget.check()
+        
+        if not state['available']:
+            self.memory_label.configure(text="🧠 Memory usage unavailable (install psutil)")
+            self.memory_gauge['value'] = 0
+            self.root.after(self.memory_check_interval, self.update_memory_gauge)
+            return
+        
+        if self.engine is not None:
+            self.engine.set_decode_limit(self.reduced_decode_size if state['downshifted'] else None)
+        
+        if state['fraction'] >= self.memory_budget.high_water:
+            level = 'danger'
+        elif state['downshifted']:
+            level = 'warning'
+        else:
+            level = 'success'
+        self.style.configure('Memory.Horizontal.TProgressbar', background=self.colors[level])
+        self.memory_gauge['value'] = min(100, state['fraction'] * 100)
+        
+        text = (f"🧠 {state['rss'] / MB:.0f} / {state['limit'] / MB:.0f} MB"
+                f" · caches {state['cache_bytes'] / MB:.0f} MB")
+        if state['downshifted']:
+            text += " · reduced resolution"
+        self.memory_label.configure(text=text)
+        
+        self.root.after(self.memory_check_interval, self.update_memory_gauge)
+        
+    def ensemble_note(self):
+        if self.last_analysis and self.last_analysis.get('ensemble'):
+            return f" (ensemble of {len(self.analyzer.ensemble_members)})"
+        return ""
+    
+    def engine_note(self):
+        if not self.last_analysis or 'backend' not in self.last_analysis:
+            return "⚡ ENGINE: fallback result"
+        stats = self.engine.stats()
+        source = "cached" if self.last_analysis['cached'] else f"{self.last_analysis['latency_ms']:.0f} ms"
+        return (f"⚡ ENGINE: {self.last_analysis['backend']} ({source}, "
+                f"{stats['cache_hits']}/{stats['calls']} cache hits)")
 
 def main():
+    parser = argparse.ArgumentParser(description="Enhanced Retinology AI desktop app")
+    parser.add_argument('--memory-budget', type=float, metavar='MB',
+                        help="RSS limit for the session (default: half of physical memory, at least 1 GB)")
+    args = parser.parse_args()
+    
     root = tk.Tk()
-    app = EnhancedMedicalApp(root)
+    app = EnhancedMedicalApp(root, memory_budget_mb=args.memory_budget)
     root.mainloop()
 
 if __name__ == "__main__":
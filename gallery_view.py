@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Virtualized Image Gallery
+Tk panel listing thousands of fundus images; only visible rows are drawn
+and only their thumbnails are decoded, in the background, into a bounded cache
+"""
+
+import os
+import queue
+import tkinter as tk
+from tkinter import ttk
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageTk
+
+
+class GalleryPanel(ttk.Frame):
+    """Scrollable list of images with analysis status and severity colour per row"""
+
+    def __init__(self, parent, classes, severity_colors, on_select=None,
+                 row_height=72, thumb_size=64, cache_size=200, decode_workers=2):
+        super().__init__(parent)
+        self.classes = classes
+        self.severity_colors = severity_colors
+        self.on_select = on_select
+        self.row_height = row_height
+        self.thumb_size = thumb_size
+        self.cache_size = cache_size
+
+        # One small dict per image; thumbnails live only in the bounded cache.
+        # Rows are keyed by normalised path: the watcher and the Tk dialogs spell paths differently
+        self.items = []
+        self.rows_by_path = {}
+        self.selected_row = None
+
+        self.thumb_cache = OrderedDict()
+        self.wanted = set()
+        self.in_flight = set()
+        self.unreadable = set()
+        self.decoded = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=decode_workers)
+
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        self.canvas = tk.Canvas(self, width=250, bg='#f8f9fa', highlightthickness=0)
+        self.canvas.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.on_scrollbar)
+        scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.scrollbar = scrollbar
+
+        # The canvas never scrolls itself; first_row is the only scroll state
+        self.first_row = 0.0
+        self.canvas.bind('<Configure>', lambda event: self.redraw())
+        self.canvas.bind('<Button-1>', self.on_click)
+        self.canvas.bind('<MouseWheel>', lambda event: self.scroll_rows(-event.delta / 120))
+        self.canvas.bind('<Button-4>', lambda event: self.scroll_rows(-1))
+        self.canvas.bind('<Button-5>', lambda event: self.scroll_rows(1))
+
+        self.after(30, self.poll_decoded)
+
+    def row_key(self, path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def add_images(self, image_paths):
+        for path in image_paths:
+            key = self.row_key(path)
+            if key in self.rows_by_path:
+                continue
+            self.rows_by_path[key] = len(self.items)
+            self.items.append({'path': path, 'status': 'pending', 'severity': None, 'confidence': None})
+        self.redraw()
+
+    def item_for(self, image_path):
+        if self.row_key(image_path) not in self.rows_by_path:
+            self.add_images([image_path])
+        return self.items[self.rows_by_path[self.row_key(image_path)]]
+
+    def update_status(self, image_path, severity, confidence):
+        self.item_for(image_path).update(status='analysed', severity=severity, confidence=confidence)
+        self.redraw()
+
+    def mark_failed(self, image_path):
+        self.item_for(image_path).update(status='failed', severity=None, confidence=None)
+        self.redraw()
+
+    def visible_rows(self):
+        height = max(1, self.canvas.winfo_height())
+        first = int(self.first_row)
+        last = min(len(self.items), first + height // self.row_height + 2)
+        return first, last
+
+    def max_first_row(self):
+        height = max(1, self.canvas.winfo_height())
+        return max(0.0, len(self.items) - height / self.row_height)
+
+    def scroll_rows(self, rows):
+        self.first_row = min(max(0.0, self.first_row + rows), self.max_first_row())
+        self.redraw()
+
+    def on_scrollbar(self, action, value, unit=None):
+        if action == 'moveto':
+            self.first_row = min(max(0.0, float(value) * len(self.items)), self.max_first_row())
+        elif action == 'scroll':
+            step = 1 if unit == 'units' else max(1, self.canvas.winfo_height() // self.row_height)
+            self.first_row = min(max(0.0, self.first_row + int(value) * step), self.max_first_row())
+        self.redraw()
+
+    def redraw(self):
+        """Draw only the rows in view; cost is independent of the number of images"""
+        self.canvas.delete('row')
+        first, last = self.visible_rows()
+        offset = (self.first_row - int(self.first_row)) * self.row_height
+        width = self.canvas.winfo_width()
+
+        wanted = set()
+        for row in range(first, last):
+            item = self.items[row]
+            top = (row - first) * self.row_height - offset
+            self.draw_row(item, row, top, width)
+            wanted.add(item['path'])
+
+        self.request_thumbnails(wanted)
+
+        total = max(1, len(self.items))
+        height = max(1, self.canvas.winfo_height())
+        self.scrollbar.set(self.first_row / total, min(1.0, (self.first_row + height / self.row_height) / total))
+
+    def draw_row(self, item, row, top, width):
+        bottom = top + self.row_height
+        background = '#d6eaf8' if row == self.selected_row else '#ffffff'
+        self.canvas.create_rectangle(0, top, width, bottom - 2, fill=background, outline='', tags='row')
+
+        if item['status'] == 'analysed':
+            color = self.severity_colors[item['severity']]
+            label = f"{self.classes[item['severity']].split(' - ')[0]} · {item['confidence']:.0%}"
+        elif item['status'] == 'failed':
+            color = '#2c3e50'
+            label = "❌ Analysis failed"
+        else:
+            color = '#bdc3c7'
+            label = "Not analysed"
+        self.canvas.create_rectangle(0, top, 6, bottom - 2, fill=color, outline='', tags='row')
+
+        photo = self.thumb_cache.get(item['path'])
+        thumb_x = 10 + self.thumb_size // 2
+        thumb_y = top + self.row_height // 2
+        if photo is not None:
+            self.thumb_cache.move_to_end(item['path'])
+            self.canvas.create_image(thumb_x, thumb_y, image=photo, tags='row')
+        else:
+            self.canvas.create_rectangle(10, thumb_y - self.thumb_size // 2,
+                                         10 + self.thumb_size, thumb_y + self.thumb_size // 2,
+                                         fill='#ecf0f1', outline='', tags='row')
+
+        text_x = 20 + self.thumb_size
+        self.canvas.create_text(text_x, top + 20, anchor='w', text=os.path.basename(item['path']),
+                                font=('Segoe UI', 9, 'bold'), tags='row')
+        self.canvas.create_text(text_x, top + 42, anchor='w', text=label, fill=color,
+                                font=('Segoe UI', 9), tags='row')
+
+    def request_thumbnails(self, wanted):
+        # Rows that scrolled away before their decode started are skipped by the worker
+        self.wanted = wanted
+        for path in wanted:
+            if path not in self.thumb_cache and path not in self.in_flight and path not in self.unreadable:
+                self.in_flight.add(path)
+                self.executor.submit(self.decode_thumbnail, path)
+
+    def decode_thumbnail(self, path):
+        if path not in self.wanted:
+            self.in_flight.discard(path)
+            return
+        try:
+            image = Image.open(path)
+            # JPEG can decode at 1/2, 1/4 or 1/8 scale, far cheaper than full size
+            image.draft('RGB', (self.thumb_size * 2, self.thumb_size * 2))
+            image = image.convert('RGB')
+            image.thumbnail((self.thumb_size, self.thumb_size), Image.Resampling.BILINEAR)
+        except Exception as e:
+            print(f"Thumbnail error for {path}: {e}")
+            image = None
+        # Cleared from in_flight on the Tk thread, once it is in the cache
+        self.decoded.put((path, image))
+
+    def poll_decoded(self):
+        """Turn decoded thumbnails into PhotoImages on the Tk thread"""
+        changed = False
+        while True:
+            try:
+                path, image = self.decoded.get_nowait()
+            except queue.Empty:
+                break
+            self.in_flight.discard(path)
+            if image is None:
+                self.unreadable.add(path)
+                continue
+            if path in self.thumb_cache or path not in self.wanted:
+                continue
+            self.thumb_cache[path] = ImageTk.PhotoImage(image)
+            changed = True
+
+        while len(self.thumb_cache) > self.cache_size:
+            self.thumb_cache.popitem(last=False)
+
+        if changed:
+            self.redraw()
+        self.after(30, self.poll_decoded)
+
+    def on_click(self, event):
+        row = int(self.first_row + event.y / self.row_height)
+        if 0 <= row < len(self.items):
+            self.selected_row = row
+            self.redraw()
+            if self.on_select is not None:
+                self.on_select(self.items[row]['path'])
+
+    def destroy(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        super().destroy()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Analysis Pipeline Load Test
+Feeds synthetic (or existing) fundus images through the inference engine at a
+target concurrency and reports throughput, latency percentiles and peak memory
+
+Usage:
+    python load_test.py --generate 200 --sizes 512,1024 --concurrency 1,2,4
+    python load_test.py --images path/to/folder --concurrency 4 --requests 1000 --tta
+    python load_test.py --backend numpy-heuristics --concurrency 1,4
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from inference_core import InferenceEngine, BACKENDS, IMAGE_EXTENSIONS
+from synthetic_fundus import generate_dataset
+from memory_budget import current_rss_bytes
+
+
+class PeakMemorySampler:
+    """Background thread recording the highest RSS seen while a run is in progress"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.peak = max(self.peak, current_rss_bytes())
+            self.stop_event.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss_bytes()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        self.thread.join()
+        self.peak = max(self.peak, current_rss_bytes())
+
+
+def run_load(engine, image_paths, concurrency, requests, options):
+    """Closed loop: `concurrency` workers each keep one analysis in flight"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            image_path = image_paths[index % len(image_paths)]
+            start = time.perf_counter()
+            try:
+                engine.predict(image_path, options)
+            except Exception as e:
+                with lock:
+                    errors.append(f"{image_path}: {e}")
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    with PeakMemorySampler() as memory:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for _ in range(concurrency):
+                executor.submit(worker)
+        elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        'concurrency': concurrency,
+        'requests': requests,
+        'completed': len(latencies),
+        'errors': len(errors),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_per_s': round(len(latencies) / elapsed, 3) if elapsed > 0 else 0.0,
+        'p50_ms': round(float(np.percentile(latencies_ms, 50)), 1),
+        'p95_ms': round(float(np.percentile(latencies_ms, 95)), 1),
+        'p99_ms': round(float(np.percentile(latencies_ms, 99)), 1),
+        'peak_rss_mb': round(memory.peak / (1024 * 1024), 1)
+    }
+
+
+def collect_images(folder):
+    image_paths = []
+    for dirpath, _, filenames in os.walk(folder):
+        for filename in sorted(filenames):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                image_paths.append(os.path.join(dirpath, filename))
+    return image_paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the retinal analysis pipeline")
+    parser.add_argument('--images', help="folder of existing images to replay")
+    parser.add_argument('--generate', type=int, default=100, help="synthetic images to generate when --images is not given")
+    parser.add_argument('--sizes', default='512', help="synthetic resolutions, e.g. 512,1024,2048")
+    parser.add_argument('--concurrency', default='1', help="comma-separated levels to sweep, e.g. 1,2,4,8")
+    parser.add_argument('--requests', type=int, default=200, help="analyses per concurrency level")
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--tta', action='store_true')
+    parser.add_argument('--ensemble', action='store_true')
+    parser.add_argument('--share-backbone', action='store_true')
+    parser.add_argument('--backend', choices=[backend.name for backend in BACKENDS],
+                        help="force one backend instead of the fastest available")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    options = {'tta': args.tta, 'ensemble': args.ensemble, 'share_backbone': args.share_backbone}
+
+    with tempfile.TemporaryDirectory(prefix="retinology_load_") as work_dir:
+        if args.images:
+            image_paths = collect_images(args.images)
+        else:
+            sizes = [int(s) for s in args.sizes.split(',')]
+            print(f"🧪 Generating {args.generate} synthetic fundus images ({args.sizes}px)...")
+            image_paths = [path for path, _ in generate_dataset(os.path.join(work_dir, "images"), args.generate, sizes)]
+        if not image_paths:
+            sys.exit("No images to replay")
+
+        # A scratch case index keeps synthetic cases out of the clinical one; the
+        # result cache is off so replayed images are really analysed every time
+        engine = InferenceEngine(args.backend, cache_size=0, case_index_dir=os.path.join(work_dir, "case_index"))
+        print(f"🤖 {engine.name}: {engine.status}")
+
+        for image_path in image_paths[:args.warmup]:
+            engine.predict(image_path, options)
+
+        results = []
+        print(f"\n{'conc':>5} {'done':>6} {'err':>4} {'img/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'peak MB':>8}")
+        for concurrency in [int(c) for c in args.concurrency.split(',')]:
+            result = run_load(engine, image_paths, concurrency, args.requests, options)
+            results.append(result)
+            print(f"{result['concurrency']:>5} {result['completed']:>6} {result['errors']:>4} "
+                  f"{result['throughput_per_s']:>8.2f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+                  f"{result['p99_ms']:>8.1f} {result['peak_rss_mb']:>8.1f}")
+
+        engine.close()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'backend': engine.name, 'options': options, 'images': len(image_paths), 'results': results}, f, indent=2)
+        print(f"\n💾 Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Memory Budget
+Keeps a long-running session under an RSS limit: tracked caches are evicted
+oldest-first under pressure, freed heap is handed back to the OS, and callers
+are told when to decode at reduced resolution
+"""
+
+import os
+import gc
+import sys
+import time
+import ctypes
+import ctypes.util
+
+MB = 1024 * 1024
+
+
+class ProcessMemoryCounters(ctypes.Structure):
+    # PROCESS_MEMORY_COUNTERS from psapi.h
+    _fields_ = [('cb', ctypes.c_ulong), ('PageFaultCount', ctypes.c_ulong),
+                ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+
+class MemoryStatusEx(ctypes.Structure):
+    # MEMORYSTATUSEX from sysinfoapi.h
+    _fields_ = [('dwLength', ctypes.c_ulong), ('dwMemoryLoad', ctypes.c_ulong),
+                ('ullTotalPhys', ctypes.c_ulonglong), ('ullAvailPhys', ctypes.c_ulonglong),
+                ('ullTotalPageFile', ctypes.c_ulonglong), ('ullAvailPageFile', ctypes.c_ulonglong),
+                ('ullTotalVirtual', ctypes.c_ulonglong), ('ullAvailVirtual', ctypes.c_ulonglong),
+                ('ullAvailExtendedVirtual', ctypes.c_ulonglong)]
+
+
+def windows_rss_bytes():
+    # The working set is what Task Manager shows; no psutil needed
+    kernel32 = ctypes.windll.kernel32
+    kernel32.GetCurrentProcess.restype = ctypes.c_void_p
+    kernel32.K32GetProcessMemoryInfo.argtypes = [ctypes.c_void_p, ctypes.POINTER(ProcessMemoryCounters),
+                                                 ctypes.c_ulong]
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    if not kernel32.K32GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+        return 0
+    return counters.WorkingSetSize
+
+
+def windows_total_memory_bytes():
+    status = MemoryStatusEx()
+    status.dwLength = ctypes.sizeof(status)
+    if not ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+        return 0
+    return status.ullTotalPhys
+
+
+def current_rss_bytes():
+    """Resident set size of this process, 0 where it cannot be read"""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    if sys.platform == 'win32':
+        return windows_rss_bytes()
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return 0
+
+
+def total_memory_bytes():
+    """Physical memory of the machine, 0 where it cannot be read"""
+    if sys.platform == 'win32':
+        return windows_total_memory_bytes()
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.virtual_memory().total
+    except ImportError:
+        return 0
+
+
+def default_limit_bytes():
+    # Half the machine, but never less than 1 GB (ResNet50 alone is ~300 MB resident)
+    return max(1024 * MB, total_memory_bytes() // 2)
+
+
+_libc = None
+
+
+def release_allocator_memory():
+    """Collect garbage and return freed allocator pages to the OS"""
+    global _libc
+    gc.collect()
+
+    # Only if torch is already loaded; this module never imports it
+    torch = sys.modules.get('torch')
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+    # glibc keeps freed decode buffers in its arenas until asked to trim them
+    if _libc is None:
+        libc_name = ctypes.util.find_library('c')
+        _libc = ctypes.CDLL(libc_name) if libc_name else False
+    if _libc and hasattr(_libc, 'malloc_trim'):
+        _libc.malloc_trim(0)
+
+
+def open_downscaled(image_path, size):
+    """RGB image decoded at the smallest JPEG scale that is still at least size x size"""
+    from PIL import Image
+    image = Image.open(image_path)
+    # A no-op for formats without DCT scaling
+    image.draft('RGB', (size, size))
+    return image.convert('RGB')
+
+
+class MemoryBudget:
+    """RSS limit with LRU eviction of registered caches and a reduced-resolution mode"""
+
+    def __init__(self, limit_mb=None, high_water=0.85, low_water=0.70, downshift_at=0.80,
+                 trim_interval=10.0, max_trim_interval=300.0):
+        self.limit = int(limit_mb * MB) if limit_mb else default_limit_bytes()
+        self.high_water = high_water
+        self.low_water = low_water
+        self.downshift_at = downshift_at
+        self.caches = []
+        self.downshifted = False
+        self.evictions = 0
+        self.rss = 0
+
+        # A heap trim takes tens of ms with ResNet50 loaded; when evicting frees nothing
+        # (the model itself fills the budget) it is retried with doubling intervals
+        self.trim_interval = trim_interval
+        self.max_trim_interval = max_trim_interval
+        self.trim_backoff = trim_interval
+        self.next_trim = 0.0
+
+    def track(self, name, cache, entry_bytes, lock=None, pinned=None):
+        """Register an OrderedDict cache (oldest first); pinned() returns keys to keep"""
+        self.caches.append({'name': name, 'cache': cache, 'entry_bytes': entry_bytes,
+                            'lock': lock, 'pinned': pinned})
+
+    def cache_bytes(self):
+        """Estimated bytes held by each tracked cache"""
+        sizes = {}
+        for tracked in self.caches:
+            items = self.snapshot(tracked)
+            sizes[tracked['name']] = sum(tracked['entry_bytes'](key, value) for key, value in items)
+        return sizes
+
+    def snapshot(self, tracked):
+        if tracked['lock'] is not None:
+            with tracked['lock']:
+                return list(tracked['cache'].items())
+        return list(tracked['cache'].items())
+
+    def evict(self, tracked, target_bytes):
+        """Drop oldest unpinned entries of one cache until target_bytes are freed"""
+        pinned = tracked['pinned']() if tracked['pinned'] is not None else ()
+        freed = 0
+        for key, value in self.snapshot(tracked):
+            if freed >= target_bytes:
+                break
+            if key in pinned:
+                continue
+            if tracked['lock'] is not None:
+                with tracked['lock']:
+                    removed = tracked['cache'].pop(key, None)
+            else:
+                removed = tracked['cache'].pop(key, None)
+            if removed is not None:
+                freed += tracked['entry_bytes'](key, value)
+                self.evictions += 1
+        return freed
+
+    def relieve(self, target_bytes):
+        """Evict from the largest caches first, then trim the heap"""
+        sizes = self.cache_bytes()
+        freed = 0
+        for tracked in sorted(self.caches, key=lambda t: sizes[t['name']], reverse=True):
+            if freed >= target_bytes:
+                break
+            freed += self.evict(tracked, target_bytes - freed)
+
+        now = time.monotonic()
+        if freed > 0 or now >= self.next_trim:
+            release_allocator_memory()
+            if freed > 0:
+                self.trim_backoff = self.trim_interval
+            else:
+                self.trim_backoff = min(self.trim_backoff * 2, self.max_trim_interval)
+            self.next_trim = now + self.trim_backoff
+        return freed
+
+    def check(self):
+        """Measure RSS, relieve pressure above the high-water mark and report the state"""
+        self.rss = current_rss_bytes()
+        if self.rss == 0:
+            # Unmeasurable here (e.g. no /proc and no psutil): the budget cannot act
+            return {'available': False, 'rss': 0, 'limit': self.limit, 'fraction': 0.0,
+                    'cache_bytes': 0, 'downshifted': False, 'evictions': self.evictions}
+
+        if self.rss >= self.limit * self.high_water:
+            self.relieve(self.rss - int(self.limit * self.low_water))
+            self.rss = current_rss_bytes()
+        else:
+            self.trim_backoff = self.trim_interval
+
+        # Hysteresis so decoding does not flip between resolutions on every check
+        fraction = self.rss / self.limit
+        if fraction >= self.downshift_at:
+            self.downshifted = True
+        elif fraction < self.low_water:
+            self.downshifted = False
+
+        return {
+            'available': True,
+            'rss': self.rss,
+            'limit': self.limit,
+            'fraction': fraction,
+            'cache_bytes': sum(self.cache_bytes().values()),
+            'downshifted': self.downshifted,
+            'evictions': self.evictions
+        }
@@ -6,7 +6,6 @@ Optimized for Android deployment without heavy dependencies
 
 import os
 import random
-import time
 from datetime import datetime
 from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
@@ -21,6 +20,7 @@ from kivy.uix.gridlayout import GridLayout
 from kivy.uix.scrollview import ScrollView
 from kivy.clock import Clock
 from kivy.metrics import dp
+from inference_core import InferenceEngine, SHORT_RECOMMENDATIONS
 
 class DiagnosisResult:
     """Class to store diagnosis results"""
@@ -30,55 +30,16 @@ class DiagnosisResult:
         self.confidence = confidence
         self.timestamp = timestamp
 
-class LightweightAIModel:
-    """Lightweight AI Model simulator for mobile deployment"""
-    
-    def __init__(self):
-        self.classes = {
-            0: "Normal - Healthy eye",
-            1: "Mild - Minor signs, monitor regularly", 
-            2: "Moderate - Needs medical attention",
-            3: "Severe - Requires immediate treatment",
-            4: "Proliferative - Urgent medical care needed"
-        }
-        self.colors = {
-            0: [0.2, 0.8, 0.2, 1],  # Green
-            1: [1, 0.8, 0, 1],      # Yellow
-            2: [1, 0.5, 0, 1],      # Orange
-            3: [1, 0.2, 0, 1],      # Red
-            4: [0.8, 0, 0, 1]       # Dark Red
-        }
-        print("✅ Lightweight AI Model loaded")
-    
-    def predict(self, image_path):
-        """Simulate AI prediction for demo purposes"""
-        try:
-            # Simulate processing time
-            time.sleep(1)
-            
-            # Simple heuristic based on filename or random for demo
-            if "normal" in image_path.lower() or "0" in os.path.basename(image_path):
-                prediction = 0
-            elif "mild" in image_path.lower() or "1" in os.path.basename(image_path):
-                prediction = 1
-            elif "moderate" in image_path.lower() or "2" in os.path.basename(image_path):
-                prediction = 2
-            elif "severe" in image_path.lower() or "3" in os.path.basename(image_path):
-                prediction = 3
-            elif "proliferative" in image_path.lower() or "4" in os.path.basename(image_path):
-                prediction = 4
-            else:
-                # Random prediction for demo
-                prediction = random.randint(0, 4)
-            
-            confidence_score = random.uniform(0.75, 0.95)
-            diagnosis = self.classes[prediction]
-            
-            return prediction, diagnosis, confidence_score
-            
-        except Exception as e:
-            print(f"❌ Prediction error: {e}")
-            return 0, "Error in analysis", 0.0
+MOBILE_BACKENDS = ('numpy-heuristics', 'pure-python-lite')
+
+# Severity colours for Kivy labels (RGBA)
+SEVERITY_COLORS = {
+    0: [0.2, 0.8, 0.2, 1],  # Green
+    1: [1, 0.8, 0, 1],      # Yellow
+    2: [1, 0.5, 0, 1],      # Orange
+    3: [1, 0.2, 0, 1],      # Red
+    4: [0.8, 0, 0, 1]       # Dark Red
+}
 
 class WelcomeScreen(Screen):
     """Welcome screen with app introduction"""
@@ -171,7 +132,7 @@ class MainScreen(Screen):
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.ai_model = LightweightAIModel()
+        self.engine = None
         self.current_image_path = None
         self.results_history = []
         self.build_ui()
@@ -343,10 +304,23 @@ class MainScreen(Screen):
             self.complete_analysis()
             return False
     
+    def get_engine(self):
+        # Loaded on first analysis; phones without numpy get the pure-Python backend.
+        # ResNet50 is desktop-only: loading it here would block the UI thread
+        if self.engine is None:
+            self.engine = InferenceEngine(latency_budget_ms=1000, allowed=MOBILE_BACKENDS)
+            print(f"✅ Inference engine loaded ({self.engine.name})")
+        return self.engine
+    
     def complete_analysis(self):
         """Complete the analysis and show results"""
         # Get AI prediction
-        prediction_class, diagnosis, confidence = self.ai_model.predict(self.current_image_path)
+        try:
+            result = self.get_engine().predict(self.current_image_path)
+            prediction_class, diagnosis, confidence = result['prediction'], result['diagnosis'], result['confidence']
+        except Exception as e:
+            print(f"❌ Prediction error: {e}")
+            prediction_class, diagnosis, confidence = 0, "Error in analysis", 0.0
         
         # Create result object
         result = DiagnosisResult(
@@ -381,7 +355,7 @@ class MainScreen(Screen):
             text=f'Diagnosis: {diagnosis}',
             font_size='18sp',
             size_hint_y=0.3,
-            color=self.ai_model.colors[prediction_class],
+            color=SEVERITY_COLORS[prediction_class],
             text_size=(dp(300), None),
             halign='center'
         )
@@ -394,16 +368,8 @@ class MainScreen(Screen):
         )
         
         # Recommendation
-        recommendations = {
-            0: "✅ No signs of diabetic retinopathy detected. Continue regular eye exams.",
-            1: "⚠️ Mild signs detected. Schedule follow-up in 6-12 months.",
-            2: "🟠 Moderate changes found. Consult ophthalmologist within 3-6 months.",
-            3: "🔴 Severe retinopathy detected. Seek immediate medical attention.",
-            4: "🚨 Advanced retinopathy. URGENT: See specialist immediately!"
-        }
-        
         recommendation_label = Label(
-            text=recommendations[prediction_class],
+            text=SHORT_RECOMMENDATIONS[prediction_class],
             font_size='14sp',
             size_hint_y=0.3,
             text_size=(dp(300), None),
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+Retinal Analysis Pipeline
+UI-free ResNet50 model loading, prediction, heatmaps and case indexing,
+shared by the desktop app and the command-line tools
+"""
+
+import os
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import torch
+import torch.nn as nn
+from torchvision import models, transforms
+from torchvision.transforms import functional as TF
+from PIL import Image
+from similar_cases import SimilarCaseIndex
+from decode_pool import DecodePool
+from cpu_plan import load_plan, apply_plan
+from inference_core import CLASSES, IMAGE_EXTENSIONS, MODEL_FILES, heuristic_prediction
+from memory_budget import open_downscaled
+
+
+class RetinalAnalyzer:
+    """Loads every available checkpoint and analyses fundus images from file paths"""
+
+    def __init__(self, model_files=MODEL_FILES, case_index_dir="case_index"):
+        self.classes = CLASSES
+        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+        # Try to load enhanced model first; every checkpoint present joins the ensemble
+        self.ensemble_members = []
+        for model_file in model_files:
+            if os.path.exists(model_file):
+                try:
+                    model = self.build_resnet50()
+                    checkpoint = torch.load(model_file, map_location=self.device)
+
+                    if isinstance(checkpoint, dict) and 'model_state_dict' in checkpoint:
+                        model.load_state_dict(checkpoint['model_state_dict'])
+                    else:
+                        model.load_state_dict(checkpoint)
+
+                    model.to(self.device)
+                    model.eval()
+                    self.ensemble_members.append({'name': model_file, 'model': model})
+                except Exception as e:
+                    print(f"Failed to load {model_file}: {e}")
+                    continue
+
+        if self.ensemble_members:
+            primary = self.ensemble_members[0]
+            self.model = primary['model']
+            self.model_status = f"✅ Enhanced Model Loaded ({primary['name']})"
+            if len(self.ensemble_members) > 1:
+                self.model_status += f" + {len(self.ensemble_members) - 1} for ensemble"
+            self.model_key = primary['name']
+            self.model_trained = True
+        else:
+            self.model = self.build_resnet50()
+            self.model.to(self.device)
+            self.model.eval()
+            self.ensemble_members.append({'name': "imagenet", 'model': self.model})
+            self.model_status = "⚠️ Using ImageNet Pre-trained Features"
+            self.model_key = "imagenet"
+            self.model_trained = False
+
+        # Checkpoints fine-tuned from one frozen backbone differ only in fc
+        self.backbone_shared = self.heads_only_differ()
+
+        # Host-tuned threads, batch size and memory format saved by cpu_plan.py
+        self.memory_format = torch.contiguous_format
+        self.batch_size = 16
+        self.execution_plan = None
+        if self.device.type == 'cpu':
+            self.execution_plan = load_plan(model_files)
+            if self.execution_plan is not None:
+                self.apply_execution_plan(self.execution_plan)
+            else:
+                # Calibrating saturates every core, so it is never started behind the user's back
+                print("⚙️ No CPU plan for this host/checkpoint; run 'python cpu_plan.py' to calibrate")
+                self.model_status += " · no CPU plan (run cpu_plan.py)"
+
+        # Intra-op threads available to split between concurrent ensemble members
+        self.total_threads = torch.get_num_threads()
+
+        # Keep layer4 feature maps from every forward for heatmaps; the lock keeps
+        # concurrent analyses (UI, watch folder, indexing) from mixing them up
+        self.layer4_activations = None
+        self.inference_lock = threading.Lock()
+        self.model.layer4.register_forward_hook(self.capture_layer4)
+
+        # ImageNet preprocessing used for every forward pass
+        self.norm_mean = [0.485, 0.456, 0.406]
+        self.norm_std = [0.229, 0.224, 0.225]
+        # Set under memory pressure: JPEGs are then decoded at reduced scale
+        self.decode_limit = None
+        self.transform = transforms.Compose([
+            transforms.Resize((224, 224)),
+            transforms.ToTensor(),
+            transforms.Normalize(self.norm_mean, self.norm_std)
+        ])
+
+        # Folder-scale decoding runs in worker processes feeding shared memory
+        self.decode_workers = max(1, (os.cpu_count() or 2) - 1)
+        self.decode_prefetch = 2
+        self.decode_pool = None
+
+        # Test-time augmentation views as (hflip, vflip, rotation degrees)
+        self.tta_views = [
+            (False, False, 0), (True, False, 0), (False, True, 0),
+            (False, False, 10), (False, False, -10), (True, False, 10)
+        ]
+        # Rotated corners are filled with normalized black, like the fundus background
+        self.tta_fill = [-m / s for m, s in zip(self.norm_mean, self.norm_std)]
+
+        # Pooled embeddings of analysed and indexed images for similar-case lookup
+        self.case_index = SimilarCaseIndex(case_index_dir)
+
+    def build_resnet50(self):
+        # Load ResNet50 for enhanced model
+        model = models.resnet50(weights=None)
+        model.fc = nn.Linear(model.fc.in_features, 5)
+        return model
+
+    def apply_execution_plan(self, plan):
+        self.memory_format = apply_plan(plan, [member['model'] for member in self.ensemble_members])
+        self.batch_size = plan['batch_size']
+        self.total_threads = torch.get_num_threads()
+        self.execution_plan = plan
+
+    def to_model_input(self, batch):
+        return batch.to(self.device, memory_format=self.memory_format)
+
+    def heads_only_differ(self):
+        """True when all loaded checkpoints share identical non-fc weights"""
+        if len(self.ensemble_members) < 2:
+            return False
+
+        reference = self.model.state_dict()
+        for member in self.ensemble_members[1:]:
+            for name, tensor in member['model'].state_dict().items():
+                if name.startswith('fc.'):
+                    continue
+                if not torch.equal(tensor, reference[name]):
+                    return False
+        return True
+
+    def analyze_path(self, image_path, options):
+        """Full analysis of one image file, independent of any UI state"""
+        # Decoding happens outside the lock so concurrent callers overlap it with inference;
+        # the heuristic path decodes for itself, at reduced size under memory pressure
+        tensor = self.preprocess_image(image_path) if self.model_trained else None
+
+        with self.inference_lock:
+            self.layer4_activations = None
+            prediction, confidence, uncertainty = self.predict_with_enhanced_model(image_path, tensor, options)
+            # Only a trained forward fills this; random-weight features explain and match nothing
+            activations = self.layer4_activations
+
+        similar_cases = []
+        if activations is not None:
+            # Global average of layer4 is exactly the 2048-d input to model.fc
+            embedding = activations.mean(dim=(1, 2)).float().cpu().numpy()
+            # Analysed cases carry the model's own label, so only confirmed cases are shown
+            similar_cases = self.case_index.search(embedding, k=5, exclude_path=image_path, source='folder')
+            if image_path not in self.case_index:
+                self.case_index.append(embedding, {
+                    'path': image_path,
+                    'label': prediction,
+                    'confidence': round(confidence, 4),
+                    'source': 'analysis',
+                    'timestamp': datetime.now().isoformat(timespec='seconds')
+                })
+
+        # Heatmaps are rendered later from these activations, without another forward
+        return {
+            'image_path': image_path,
+            'prediction': prediction,
+            'confidence': confidence,
+            'uncertainty': uncertainty,
+            'activations': activations,
+            'ensemble': bool(options.get('ensemble')) and len(self.ensemble_members) > 1,
+            'similar_cases': similar_cases
+        }
+
+    def predict_with_enhanced_model(self, image_path, tensor, options):
+        # TTA views of an untrained network agree perfectly on noise, so it is never used
+        if not self.model_trained:
+            # Use intelligent image analysis since model isn't trained on retinal data;
+            # an unreadable image raises, like preprocess_image does for the model path
+            prediction, confidence = heuristic_prediction(image_path, self.decode_limit)
+            return prediction, confidence, None
+
+        try:
+            return self.predict_with_model(tensor, options)
+        except Exception as e:
+            print(f"Enhanced model prediction error: {e}")
+            return 0, 0.75, None
+
+    def preprocess_image(self, image_path):
+        """Decode an image into a normalized 1x3x224x224 tensor"""
+        if self.decode_limit:
+            image = open_downscaled(image_path, self.decode_limit)
+        else:
+            image = Image.open(image_path).convert('RGB')
+        return self.transform(image).unsqueeze(0)
+
+    def apply_tta_view(self, tensor, hflip, vflip, angle):
+        """One flipped/rotated view of every image in a preprocessed batch"""
+        if hflip:
+            tensor = TF.hflip(tensor)
+        if vflip:
+            tensor = TF.vflip(tensor)
+        if angle:
+            tensor = TF.rotate(tensor, angle, fill=self.tta_fill)
+        return tensor
+
+    def build_tta_batch(self, tensor):
+        """Stack flipped and rotated views of a preprocessed tensor into one batch"""
+        return torch.cat([self.apply_tta_view(tensor, *view) for view in self.tta_views], dim=0)
+
+    def model_probabilities(self, batch, options):
+        """Softmax per row of a model-ready batch, averaged over the ensemble when requested"""
+        if options.get('ensemble') and len(self.ensemble_members) > 1:
+            return self.ensemble_probabilities(batch, options.get('share_backbone'))
+        return torch.softmax(self.model(batch), dim=1)
+
+    def predict_with_model(self, tensor, options):
+        """Run the ResNet50 once, over all TTA views in a single batch when enabled"""
+        tta = options.get('tta')
+
+        # Preprocessed once by the caller, whatever the number of ensemble members
+        batch = tensor
+        if tta:
+            batch = self.build_tta_batch(batch)
+        batch = self.to_model_input(batch)
+
+        with torch.inference_mode():
+            probabilities = self.model_probabilities(batch, options)
+
+        mean_probs = probabilities.mean(dim=0)
+        prediction = int(mean_probs.argmax())
+
+        # Per-class variance across views doubles as the uncertainty score
+        uncertainty = None
+        if tta:
+            uncertainty = probabilities.var(dim=0, unbiased=False).tolist()
+
+        return prediction, float(mean_probs[prediction]), uncertainty
+
+    def classify_paths(self, image_paths, options, batch_size=None):
+        """Classify many images with pool decoding; yields ({path: result}, {path: error}) per batch.
+
+        Results carry prediction, confidence and uncertainty like analyze_path, but no
+        activations or similar cases, and the images are not added to the case index.
+        """
+        tta = options.get('tta')
+        views = self.tta_views if tta else [(False, False, 0)]
+        ensemble = bool(options.get('ensemble')) and len(self.ensemble_members) > 1
+
+        pool = self.get_decode_pool(batch_size or self.batch_size)
+        for batch, paths, errors in pool.iter_batches(list(image_paths)):
+            results = {}
+            if paths:
+                # One forward per TTA view over the whole batch keeps peak memory at one batch
+                with self.inference_lock, torch.inference_mode():
+                    batch = torch.from_numpy(batch)
+                    probabilities = torch.stack([
+                        self.model_probabilities(self.to_model_input(self.apply_tta_view(batch, *view)), options)
+                        for view in views])
+
+                mean_probs = probabilities.mean(dim=0)
+                for row, path in enumerate(paths):
+                    prediction = int(mean_probs[row].argmax())
+                    results[path] = {
+                        'image_path': path,
+                        'prediction': prediction,
+                        'confidence': float(mean_probs[row, prediction]),
+                        'uncertainty': probabilities[:, row].var(dim=0, unbiased=False).tolist() if tta else None,
+                        'ensemble': ensemble
+                    }
+            yield results, errors
+
+    def extract_features(self, model, batch):
+        """Pooled 2048-d ResNet50 features, i.e. the input to model.fc"""
+        x = model.maxpool(model.relu(model.bn1(model.conv1(batch))))
+        x = model.layer4(model.layer3(model.layer2(model.layer1(x))))
+        return torch.flatten(model.avgpool(x), 1)
+
+    def ensemble_probabilities(self, batch, share_backbone=False):
+        """Average softmax of every loaded checkpoint over the same preprocessed batch"""
+        if share_backbone and self.backbone_shared:
+            # One backbone pass, then only the cheap linear heads per checkpoint
+            features = self.extract_features(self.model, batch)
+            member_probs = [torch.softmax(member['model'].fc(features), dim=1)
+                            for member in self.ensemble_members]
+            return torch.stack(member_probs).mean(dim=0)
+
+        # Split intra-op threads so concurrent members don't oversubscribe the cores
+        threads_per_member = max(1, self.total_threads // len(self.ensemble_members))
+
+        def run_member(member):
+            torch.set_num_threads(threads_per_member)
+            with torch.inference_mode():
+                return torch.softmax(member['model'](batch), dim=1)
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(self.ensemble_members)) as executor:
+                member_probs = list(executor.map(run_member, self.ensemble_members))
+        finally:
+            torch.set_num_threads(self.total_threads)
+
+        return torch.stack(member_probs).mean(dim=0)
+
+    def infer_case_label(self, image_path):
+        """Class from a dataset-style parent folder name (0-4 or a class keyword)"""
+        folder = os.path.basename(os.path.dirname(image_path)).lower()
+        if folder in ('0', '1', '2', '3', '4'):
+            return int(folder)
+        for class_id, name in self.classes.items():
+            if name.split(' - ')[0].lower() in folder:
+                return class_id
+        return None
+
+    def build_case_index_from_folder(self, folder, batch_size=None, progress=None):
+        """Embed new images under folder as confirmed cases, relabelling analysed ones; returns the count"""
+        if not self.model_trained:
+            print("Case indexing needs a trained checkpoint; skipping")
+            return 0
+
+        batch_size = batch_size or self.batch_size
+        image_paths = []
+        upgrades = {}
+        for dirpath, _, filenames in os.walk(folder):
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                if not filename.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                case = self.case_index.get(path)
+                if case is None:
+                    image_paths.append(path)
+                elif case.get('source') == 'analysis':
+                    # Analysed earlier with the same model: the embedding stands, only the label is confirmed
+                    upgrades[path] = {'label': self.infer_case_label(path), 'source': 'folder'}
+
+        indexed = 0
+        if upgrades:
+            self.case_index.relabel(upgrades)
+            indexed = len(upgrades)
+            if progress is not None:
+                progress(indexed, len(image_paths) + len(upgrades))
+
+        pool = self.get_decode_pool(batch_size)
+        for batch, paths, errors in pool.iter_batches(image_paths):
+            for path, error in errors.items():
+                print(f"Skipping {path}: {error}")
+            if not paths:
+                continue
+
+            # from_numpy shares the slab memory; nothing is copied on CPU unless
+            # the tuned plan asks for channels_last
+            with self.inference_lock, torch.inference_mode():
+                features = self.extract_features(self.model, self.to_model_input(torch.from_numpy(batch)))
+
+            cases = [{'path': path, 'label': self.infer_case_label(path), 'source': 'folder'}
+                     for path in paths]
+            self.case_index.extend(features.float().cpu().numpy(), cases)
+
+            indexed += len(cases)
+            if progress is not None:
+                progress(indexed, len(image_paths) + len(upgrades))
+
+        return indexed
+
+    def get_decode_pool(self, batch_size):
+        # Worker processes are spawned once and reused for later folders
+        if self.decode_pool is None or self.decode_pool.batch_size != batch_size:
+            if self.decode_pool is not None:
+                self.decode_pool.close()
+            self.decode_pool = DecodePool(workers=self.decode_workers,
+                                          prefetch=self.decode_prefetch,
+                                          batch_size=batch_size,
+                                          mean=self.norm_mean, std=self.norm_std)
+        return self.decode_pool
+
+    def capture_layer4(self, module, inputs, output):
+        # View 0 is always the un-augmented image; cloned so the cached result does not
+        # keep the whole TTA batch's layer4 output alive behind the view
+        self.layer4_activations = output[0].detach().clone()
+
+    def compute_heatmap(self, activations, class_id):
+        """Grad-CAM map in [0, 1] for one class from cached layer4 activations"""
+        # layer4 feeds global average pooling and a linear head, so the gradient of
+        # the class score w.r.t. each feature map is fc.weight[class_id] / (h * w).
+        # That is the exact Grad-CAM weighting, with no backward pass needed.
+        with torch.inference_mode():
+            weights = self.model.fc.weight[class_id].detach().to(activations.device)
+            cam = torch.relu(torch.einsum('c,chw->hw', weights, activations))
+            peak = cam.max()
+            if peak > 0:
+                cam = cam / peak
+        return cam.cpu().numpy()
+
+    def close(self):
+        if self.decode_pool is not None:
+            self.decode_pool.close()
+            self.decode_pool = None
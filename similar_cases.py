@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Similar Case Retrieval Index
+Stores ResNet50 pooled embeddings in a compact float16 memory-mapped matrix
+and returns the nearest prior cases for a new retinal image
+"""
+
+import os
+import json
+import threading
+import numpy as np
+
+
+class SimilarCaseIndex:
+    """Append-only cosine similarity index over 2048-d image embeddings"""
+
+    def __init__(self, index_dir="case_index", dim=2048, sketch_dim=128, center_after=1024):
+        self.index_dir = index_dir
+        self.dim = dim
+        self.sketch_dim = sketch_dim
+        self.center_after = center_after
+        self.vectors_path = os.path.join(index_dir, "embeddings.f16")
+        self.sketch_path = os.path.join(index_dir, "sketch_centered.f16")
+        self.center_path = os.path.join(index_dir, "center.f32")
+        self.cases_path = os.path.join(index_dir, "cases.jsonl")
+        self.lock = threading.Lock()
+
+        # Fixed random projection of the mean-centred embedding. ReLU features all
+        # share a large common component that would swamp an uncentred sketch
+        rng = np.random.default_rng(2048)
+        self.projection = rng.standard_normal((dim, sketch_dim)).astype(np.float32)
+        self.projection /= np.sqrt(sketch_dim)
+
+        # Sketch rows are the projection plus the exact dot product with the centre,
+        # since x.q = (x - c).(q - c) + c.x + c.q - c.c and only c.x varies per case
+        self.sketch_width = sketch_dim + 1
+        self.center = None
+
+        self.cases = []
+        self.case_rows = {}
+        self.capacity = 0
+        self.vectors = None
+        self.sketch = np.zeros((0, self.sketch_width), dtype=np.float32)
+
+        # Small integer code per row's source, so searches filter before the shortlist
+        self.source_codes = {}
+        self.row_sources = np.zeros(0, dtype=np.int16)
+
+        if os.path.exists(self.cases_path):
+            self.load()
+
+    def __len__(self):
+        return len(self.cases)
+
+    def __contains__(self, image_path):
+        return os.path.abspath(image_path) in self.case_rows
+
+    def get(self, image_path):
+        """Metadata of the case stored for image_path, None if it is not indexed"""
+        row = self.case_rows.get(os.path.abspath(image_path))
+        return self.cases[row] if row is not None else None
+
+    def source_code(self, source):
+        if source not in self.source_codes:
+            self.source_codes[source] = len(self.source_codes)
+        return self.source_codes[source]
+
+    def load(self):
+        with open(self.cases_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    self.cases.append(json.loads(line))
+
+        # Rows past the last metadata line belong to an interrupted append
+        self.capacity = os.path.getsize(self.vectors_path) // (self.dim * 2)
+        self.cases = self.cases[:self.capacity]
+        self.case_rows = {case['path']: row for row, case in enumerate(self.cases)}
+        self.row_sources = np.zeros(self.capacity, dtype=np.int16)
+        self.row_sources[:len(self.cases)] = [self.source_code(case.get('source')) for case in self.cases]
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float16, mode='r+',
+                                 shape=(self.capacity, self.dim))
+
+        # The centre file is written after the sketch, so its presence means the sketch is valid
+        if os.path.exists(self.center_path) and os.path.exists(self.sketch_path):
+            self.center = np.fromfile(self.center_path, dtype=np.float32)
+            stored_sketch = np.memmap(self.sketch_path, dtype=np.float16, mode='r',
+                                      shape=(self.capacity, self.sketch_width))
+            self.sketch = np.array(stored_sketch, dtype=np.float32)
+            del stored_sketch
+        else:
+            # Indexes written before centring get their sketch rebuilt once
+            with open(self.sketch_path, 'wb') as f:
+                f.truncate(self.capacity * self.sketch_width * 2)
+            self.sketch = np.zeros((self.capacity, self.sketch_width), dtype=np.float32)
+            if len(self.cases) >= self.center_after:
+                self.fit_center(len(self.cases))
+
+    def reserve(self, rows):
+        """Grow the memory-mapped files, doubling so appends stay amortised O(1)"""
+        if rows <= self.capacity:
+            return
+
+        new_capacity = max(rows, self.capacity * 2, 1024)
+        os.makedirs(self.index_dir, exist_ok=True)
+
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.vectors = None
+
+        for path, width in ((self.vectors_path, self.dim), (self.sketch_path, self.sketch_width)):
+            with open(path, 'ab') as f:
+                f.truncate(new_capacity * width * 2)
+
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float16, mode='r+',
+                                 shape=(new_capacity, self.dim))
+
+        # The in-memory sketch grows the same way instead of being re-concatenated per append
+        sketch = np.zeros((new_capacity, self.sketch_width), dtype=np.float32)
+        sketch[:len(self.cases)] = self.sketch[:len(self.cases)]
+        self.sketch = sketch
+
+        row_sources = np.zeros(new_capacity, dtype=np.int16)
+        row_sources[:len(self.cases)] = self.row_sources[:len(self.cases)]
+        self.row_sources = row_sources
+        self.capacity = new_capacity
+
+    def normalize(self, embeddings):
+        embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+    def build_sketch(self, embeddings, center):
+        sketches = np.empty((len(embeddings), self.sketch_width), dtype=np.float32)
+        sketches[:, :-1] = (embeddings - center) @ self.projection
+        sketches[:, -1] = embeddings @ center
+        return sketches
+
+    def write_sketch(self, start, sketches):
+        stored_sketch = np.memmap(self.sketch_path, dtype=np.float16, mode='r+',
+                                  shape=(self.capacity, self.sketch_width))
+        stored_sketch[start:start + len(sketches)] = sketches.astype(np.float16)
+        stored_sketch.flush()
+        del stored_sketch
+        self.sketch[start:start + len(sketches)] = sketches.astype(np.float16)
+
+    def fit_center(self, rows, chunk=65536):
+        """Fix the centre to the mean of the first rows and sketch every row with it"""
+        total = np.zeros(self.dim, dtype=np.float64)
+        for start in range(0, rows, chunk):
+            total += self.vectors[start:min(rows, start + chunk)].astype(np.float32).sum(axis=0)
+        center = (total / rows).astype(np.float32)
+
+        for start in range(0, rows, chunk):
+            block = self.vectors[start:min(rows, start + chunk)].astype(np.float32)
+            self.write_sketch(start, self.build_sketch(block, center))
+
+        center.tofile(self.center_path)
+        self.center = center
+
+    def extend(self, embeddings, cases):
+        """Append a batch of embeddings with one metadata dict per row"""
+        embeddings = self.normalize(embeddings)
+
+        with self.lock:
+            start = len(self.cases)
+            end = start + len(cases)
+            self.reserve(end)
+
+            self.vectors[start:end] = embeddings.astype(np.float16)
+            self.vectors.flush()
+
+            # Small indexes are scanned exactly; the centre is fixed once there is enough data
+            if self.center is not None:
+                self.write_sketch(start, self.build_sketch(embeddings, self.center))
+            elif end >= self.center_after:
+                self.fit_center(end)
+
+            # Metadata is written last, so it decides which rows are committed
+            with open(self.cases_path, 'a', encoding='utf-8') as f:
+                for case in cases:
+                    case = dict(case, path=os.path.abspath(case['path']))
+                    f.write(json.dumps(case) + "\n")
+                    self.row_sources[len(self.cases)] = self.source_code(case.get('source'))
+                    self.case_rows[case['path']] = len(self.cases)
+                    self.cases.append(case)
+
+    def append(self, embedding, case):
+        self.extend(embedding, [case])
+
+    def relabel(self, updates):
+        """Merge {path: fields} into existing cases' metadata; the embeddings are unchanged"""
+        with self.lock:
+            for path, fields in updates.items():
+                row = self.case_rows[os.path.abspath(path)]
+                self.cases[row] = dict(self.cases[row], **fields)
+                self.row_sources[row] = self.source_code(self.cases[row].get('source'))
+
+            # Same number of lines, replaced in one step, so committed rows stay committed
+            temp_path = self.cases_path + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                for case in self.cases:
+                    f.write(json.dumps(case) + "\n")
+            os.replace(temp_path, self.cases_path)
+
+    def search(self, embedding, k=5, exclude_path=None, source=None, shortlist_size=1000):
+        """Top-k most similar cases as (similarity, case) pairs, optionally from one source"""
+        with self.lock:
+            count = len(self.cases)
+            if count == 0:
+                return []
+
+            query = self.normalize(embedding)[0]
+
+            # Filtering first keeps a flood of other-source rows out of the shortlist
+            if source is None:
+                candidates = np.arange(count)
+            elif source in self.source_codes:
+                candidates = np.flatnonzero(self.row_sources[:count] == self.source_codes[source])
+            else:
+                return []
+
+            if self.center is None or len(candidates) <= shortlist_size:
+                shortlist = candidates
+            else:
+                # Coarse scan over the in-memory sketch, then exact rerank from the memmap
+                # The trailing 1 picks up each row's centre term in the same pass
+                coarse = self.sketch[:count] @ np.append((query - self.center) @ self.projection, 1.0).astype(np.float32)
+                if source is not None:
+                    coarse[self.row_sources[:count] != self.source_codes[source]] = -np.inf
+                shortlist = np.argpartition(-coarse, shortlist_size - 1)[:shortlist_size]
+                shortlist.sort()
+
+            exact = self.vectors[shortlist].astype(np.float32) @ query
+            order = np.argsort(-exact)
+
+            exclude_path = os.path.abspath(exclude_path) if exclude_path else None
+            results = []
+            for i in order:
+                case = self.cases[shortlist[i]]
+                if case['path'] == exclude_path:
+                    continue
+                results.append((float(exact[i]), case))
+                if len(results) == k:
+                    break
+            return results
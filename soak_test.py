@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Memory Soak Test
+Runs thousands of analyses through the same decode, inference, cache and
+memory-budget path as the desktop app (without Tk) and checks that RSS
+stays flat once the caches have filled
+
+Usage:
+    python soak_test.py --analyses 5000 --budget 1500
+    python soak_test.py --backend numpy-heuristics --analyses 20000 --budget 600
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+from collections import OrderedDict
+import numpy as np
+from PIL import Image, ImageEnhance
+from inference_core import InferenceEngine, BACKENDS
+from synthetic_fundus import generate_dataset
+from memory_budget import MemoryBudget, current_rss_bytes, open_downscaled, MB
+
+
+def soak(engine, budget, image_paths, analyses, check_every=10, samples=50, reduced_decode_size=448):
+    """Analyse images round-robin; returns [(analyses done, rss bytes, cache bytes), ...]"""
+    # Stands in for the app's heatmap cache: rendered previews per analysed image
+    heatmaps = OrderedDict()
+    budget.track("heatmaps", heatmaps, lambda key, value: value[0].width * value[0].height * 3 + value[1].nbytes)
+    budget.track("results", engine.cache, engine.result_bytes, lock=engine.lock)
+    analyzer = getattr(engine.backend, 'analyzer', None)
+
+    sample_every = max(1, analyses // samples)
+    trace = []
+    for i in range(analyses):
+        image_path = image_paths[i % len(image_paths)]
+
+        # What load_image does for the preview
+        preview = open_downscaled(image_path, 400)
+        preview.thumbnail((400, 400), Image.Resampling.LANCZOS)
+        preview = ImageEnhance.Contrast(preview).enhance(1.2)
+
+        # Alternate options so the result cache keeps missing and being refilled
+        result = engine.predict(image_path, {'tta': i % 2 == 1})
+
+        if analyzer is not None and result['activations'] is not None:
+            cam = analyzer.compute_heatmap(result['activations'], result['prediction'])
+        else:
+            cam = np.zeros((7, 7), dtype=np.float32)
+        heatmaps[(image_path, i % 2)] = (preview, cam)
+        if len(heatmaps) > 32:
+            heatmaps.popitem(last=False)
+
+        # The app checks on a timer; here every few analyses
+        if i % check_every == 0:
+            state = budget.check()
+            engine.set_decode_limit(reduced_decode_size if state['downshifted'] else None)
+
+        if i % sample_every == 0 or i == analyses - 1:
+            trace.append((i + 1, current_rss_bytes(), sum(budget.cache_bytes().values())))
+            if len(trace) % 10 == 0:
+                print(f"  {i + 1:>7} analyses  RSS {trace[-1][1] / MB:8.1f} MB  "
+                      f"caches {trace[-1][2] / MB:6.1f} MB  evictions {budget.evictions}")
+
+    return trace
+
+
+def growth_per_1000(trace, warmup_fraction):
+    """Least-squares RSS slope in MB per 1000 analyses, ignoring the cache warm-up"""
+    steady = trace[int(len(trace) * warmup_fraction):]
+    if len(steady) < 2:
+        return 0.0
+    done = np.array([point[0] for point in steady], dtype=np.float64)
+    rss = np.array([point[1] for point in steady], dtype=np.float64) / MB
+    return float(np.polyfit(done, rss, 1)[0] * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that RSS stays flat over a long session")
+    parser.add_argument('--analyses', type=int, default=3000)
+    parser.add_argument('--images', type=int, default=60, help="distinct synthetic images to cycle through")
+    parser.add_argument('--sizes', default='512,1024,2048', help="synthetic resolutions")
+    parser.add_argument('--budget', type=float, metavar='MB', help="memory budget (default: as the app)")
+    parser.add_argument('--backend', choices=[backend.name for backend in BACKENDS],
+                        help="force one backend instead of the fastest available")
+    parser.add_argument('--warmup', type=float, default=0.2, help="fraction of the run excluded from the slope")
+    parser.add_argument('--max-growth', type=float, default=5.0, help="allowed MB of RSS growth per 1000 analyses")
+    parser.add_argument('--json', help="also write the RSS trace to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="retinology_soak_") as work_dir:
+        sizes = [int(s) for s in args.sizes.split(',')]
+        print(f"🧪 Generating {args.images} synthetic fundus images ({args.sizes}px)...")
+        image_paths = [path for path, _ in generate_dataset(os.path.join(work_dir, "images"), args.images, sizes)]
+
+        engine = InferenceEngine(args.backend, case_index_dir=os.path.join(work_dir, "case_index"))
+        budget = MemoryBudget(args.budget)
+        print(f"🤖 {engine.name}, budget {budget.limit / MB:.0f} MB, {args.analyses} analyses")
+
+        trace = soak(engine, budget, image_paths, args.analyses)
+        engine.close()
+
+    slope = growth_per_1000(trace, args.warmup)
+    peak = max(point[1] for point in trace)
+    print(f"\n📈 RSS growth after warm-up: {slope:+.2f} MB per 1000 analyses "
+          f"(peak {peak / MB:.1f} MB, {budget.evictions} cache evictions)")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'backend': engine.name, 'budget_mb': budget.limit / MB, 'growth_mb_per_1000': slope,
+                       'trace': [{'analyses': n, 'rss_mb': rss / MB, 'cache_mb': cache / MB}
+                                 for n, rss, cache in trace]}, f, indent=2)
+
+    if slope > args.max_growth:
+        sys.exit(f"❌ RSS is growing faster than {args.max_growth} MB per 1000 analyses")
+    if peak > budget.limit:
+        sys.exit(f"❌ Peak RSS exceeded the {budget.limit / MB:.0f} MB budget")
+    print("✅ RSS stayed flat within the budget")
+
+
+if __name__ == "__main__":
+    main()
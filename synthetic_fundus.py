@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Synthetic Fundus Image Generator
+Creates realistic-looking retinal fundus images for load testing without
+patient data: a circular disc on a black field with an optic disc, macula,
+branching vessels and severity-dependent lesions for the five classes
+
+Usage:
+    python synthetic_fundus.py OUTPUT_DIR --count 500 --sizes 512,1024
+"""
+
+import os
+import math
+import argparse
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+# Lesion counts per severity class (see CLASSES in inference_core.py):
+# microaneurysms, blot hemorrhages, hard exudates, cotton wool spots, new vessels
+LESION_PROFILES = {
+    0: (0, 0, 0, 0, 0),
+    1: (8, 1, 0, 0, 0),
+    2: (20, 6, 10, 2, 0),
+    3: (35, 18, 25, 6, 0),
+    4: (40, 22, 30, 8, 6)
+}
+
+
+def random_point_in_disc(rng, center, radius, margin=0.9):
+    r = radius * margin * math.sqrt(rng.random())
+    theta = rng.random() * 2 * math.pi
+    return center[0] + r * math.cos(theta), center[1] + r * math.sin(theta)
+
+
+def draw_vessel(draw, rng, start, angle, length, width, color, depth=0):
+    """Random-walk vessel that thins and branches as it leaves the optic disc"""
+    x, y = start
+    steps = max(4, int(length / 6))
+    step = length / steps
+    for i in range(steps):
+        angle += rng.normal(0, 0.12)
+        nx, ny = x + step * math.cos(angle), y + step * math.sin(angle)
+        w = max(1, int(width * (1 - 0.6 * i / steps)))
+        draw.line([(x, y), (nx, ny)], fill=color, width=w)
+        x, y = nx, ny
+
+        if depth < 3 and rng.random() < 0.08:
+            branch_angle = angle + rng.choice([-1, 1]) * rng.uniform(0.4, 0.9)
+            draw_vessel(draw, rng, (x, y), branch_angle, length * 0.5, max(1, w - 1), color, depth + 1)
+
+
+def generate_fundus(severity, size=512, seed=None):
+    """One RGB fundus image of the given severity class (0-4)"""
+    rng = np.random.default_rng(seed)
+    center = (size / 2, size / 2)
+    radius = size * 0.46
+
+    # Orange-red retina with radial vignetting on a black field
+    yy, xx = np.mgrid[0:size, 0:size].astype(np.float32)
+    dist = np.sqrt((xx - center[0]) ** 2 + (yy - center[1]) ** 2) / radius
+    shade = np.clip(1.0 - 0.45 * dist ** 2, 0, 1)
+    base_color = np.array([200, 85, 40], dtype=np.float32) * rng.uniform(0.85, 1.1, size=3)
+    pixels = shade[..., None] * base_color[None, None, :]
+    pixels += rng.normal(0, 4, size=pixels.shape)
+    pixels[dist > 1.0] = 0
+    image = Image.fromarray(np.uint8(np.clip(pixels, 0, 255)))
+    draw = ImageDraw.Draw(image)
+
+    # Optic disc on one side, macula slightly below centre on the other
+    side = rng.choice([-1, 1])
+    disc = (center[0] + side * radius * 0.45, center[1] + rng.uniform(-0.05, 0.05) * radius)
+    disc_r = radius * 0.11
+    draw.ellipse([disc[0] - disc_r, disc[1] - disc_r, disc[0] + disc_r, disc[1] + disc_r],
+                 fill=(245, 200, 120))
+    macula = (center[0] - side * radius * 0.1, center[1] + radius * 0.05)
+    macula_r = radius * 0.09
+    draw.ellipse([macula[0] - macula_r, macula[1] - macula_r, macula[0] + macula_r, macula[1] + macula_r],
+                 fill=(140, 50, 25))
+
+    # Arcades leave the disc up and down, towards the macula
+    vessel_color = (120, 20, 15)
+    for k in range(8):
+        angle = -side * math.pi / 2 * (1 if k % 2 else -1) * rng.uniform(0.3, 1.0)
+        angle = angle if side < 0 else math.pi + angle
+        draw_vessel(draw, rng, disc, angle, radius * rng.uniform(0.7, 1.2),
+                    max(2, size // 120), vessel_color)
+
+    microaneurysms, hemorrhages, exudates, cotton_wool, new_vessels = LESION_PROFILES[severity]
+    scale = size / 512
+
+    for _ in range(microaneurysms):
+        x, y = random_point_in_disc(rng, center, radius)
+        r = rng.uniform(1.5, 3) * scale
+        draw.ellipse([x - r, y - r, x + r, y + r], fill=(90, 10, 10))
+
+    for _ in range(hemorrhages):
+        x, y = random_point_in_disc(rng, center, radius)
+        r = rng.uniform(5, 14) * scale
+        draw.ellipse([x - r, y - r * rng.uniform(0.6, 1), x + r, y + r], fill=(70, 5, 5))
+
+    for _ in range(exudates):
+        cx, cy = random_point_in_disc(rng, center, radius * 0.7)
+        for _ in range(rng.integers(2, 6)):
+            x, y = cx + rng.normal(0, 8 * scale), cy + rng.normal(0, 8 * scale)
+            r = rng.uniform(2, 5) * scale
+            draw.ellipse([x - r, y - r, x + r, y + r], fill=(250, 230, 120))
+
+    for _ in range(cotton_wool):
+        x, y = random_point_in_disc(rng, center, radius * 0.8)
+        r = rng.uniform(8, 16) * scale
+        draw.ellipse([x - r, y - r * 0.7, x + r, y + r * 0.7], fill=(235, 210, 180))
+
+    # Proliferative: fine tortuous vessels growing from the disc
+    for _ in range(new_vessels):
+        draw_vessel(draw, rng, disc, rng.uniform(0, 2 * math.pi), radius * 0.25,
+                    1, (150, 25, 25), depth=2)
+
+    image = image.filter(ImageFilter.GaussianBlur(radius=max(0.6, size / 700)))
+
+    # Re-apply the black field that blurring softened
+    mask = Image.fromarray(np.uint8(dist <= 1.0) * 255)
+    black = Image.new('RGB', image.size)
+    return Image.composite(image, black, mask)
+
+
+def generate_dataset(output_dir, count, sizes=(512,), seed=0, quality=92):
+    """Write count images into output_dir/<class>/; returns [(path, severity), ...]"""
+    rng = np.random.default_rng(seed)
+    generated = []
+    for i in range(count):
+        severity = int(rng.integers(0, 5))
+        size = int(sizes[i % len(sizes)])
+        class_dir = os.path.join(output_dir, str(severity))
+        os.makedirs(class_dir, exist_ok=True)
+
+        path = os.path.join(class_dir, f"fundus_{i:06d}_{size}px.jpg")
+        generate_fundus(severity, size, seed=int(rng.integers(1 << 31))).save(path, quality=quality)
+        generated.append((path, severity))
+    return generated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic fundus images")
+    parser.add_argument('output_dir')
+    parser.add_argument('--count', type=int, default=100)
+    parser.add_argument('--sizes', default='512', help="comma-separated resolutions, e.g. 512,1024,2048")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    generated = generate_dataset(args.output_dir, args.count, sizes, args.seed)
+    print(f"✅ Generated {len(generated)} synthetic fundus images in {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Watch-Folder Ingestion
+Persistent file index and a folder watcher that hands new or changed
+fundus images to the analyzer exactly once
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    WATCHDOG_AVAILABLE = False
+
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileIndex:
+    """Path -> size/mtime/hash/result records kept in an append-only JSONL journal"""
+
+    def __init__(self, index_path="watch_index.jsonl"):
+        self.index_path = index_path
+        self.records = {}
+        self.lock = threading.Lock()
+        if os.path.exists(index_path):
+            self.load()
+
+    def load(self):
+        lines = 0
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn last line from an interrupted write
+                    continue
+                self.records[record['path']] = record
+                lines += 1
+
+        # Later lines supersede earlier ones; compact once the journal is mostly stale
+        if lines > 2 * len(self.records) + 100:
+            self.compact()
+
+    def compact(self):
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for record in self.records.values():
+                f.write(json.dumps(record) + "\n")
+        os.replace(temp_path, self.index_path)
+
+    def get(self, path):
+        return self.records.get(path)
+
+    def update(self, record):
+        with self.lock:
+            self.records[record['path']] = record
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + "\n")
+
+
+class FolderWatcher:
+    """Polls (or is woken by filesystem events) and processes settled new/changed images"""
+
+    def __init__(self, folder, on_image, file_index, extensions,
+                 poll_interval=2.0, settle_time=2.0, on_failure=None,
+                 max_attempts=5, retry_delay=30.0, safety_interval=300.0,
+                 on_batch=None, batch_size=16):
+        self.folder = folder
+        self.root = os.path.abspath(folder)
+        self.on_image = on_image
+        # on_batch(paths) -> ({path: result}, {path: error}) takes backlogs batch_size at a time
+        self.on_batch = on_batch
+        self.batch_size = batch_size
+        self.on_failure = on_failure
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.file_index = file_index
+        self.extensions = extensions
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        # With notifications, the whole tree is only walked this often, to catch missed events
+        self.safety_interval = safety_interval
+
+        # path -> (size, mtime) seen on the previous poll, for debouncing
+        self.pending = {}
+        # Paths named by filesystem events since the last scan
+        self.dirty = set()
+        self.full_scan = True
+        self.dirty_lock = threading.Lock()
+        self.wake_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.observer = None
+
+    def start(self):
+        if WATCHDOG_AVAILABLE:
+            handler = FileSystemEventHandler()
+            handler.on_any_event = self.on_event
+            self.observer = Observer()
+            self.observer.schedule(handler, self.folder, recursive=True)
+            self.observer.start()
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake_event.set()
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer = None
+
+    def on_event(self, event):
+        with self.dirty_lock:
+            if event.is_directory:
+                # A directory created or moved in whole brings files without events of their own
+                if event.event_type in ('created', 'moved'):
+                    self.full_scan = True
+            else:
+                for path in (event.src_path, getattr(event, 'dest_path', '')):
+                    if path and path.lower().endswith(self.extensions):
+                        self.dirty.add(os.path.abspath(path))
+        self.wake_event.set()
+
+    def run(self):
+        next_full_scan = 0.0
+        while not self.stop_event.is_set():
+            # Cleared before the dirty set is taken, so an event during the scan wakes the next one
+            self.wake_event.clear()
+            with self.dirty_lock:
+                dirty, self.dirty = self.dirty, set()
+                full_scan = self.full_scan or self.observer is None or time.time() >= next_full_scan
+                self.full_scan = False
+
+            try:
+                if full_scan:
+                    self.scan()
+                    next_full_scan = time.time() + self.safety_interval
+                else:
+                    # Only what changed, what is still settling and what is due for a retry
+                    self.scan(dirty | set(self.pending) | set(self.due_retries(time.time())))
+            except Exception as e:
+                print(f"Watch folder scan error: {e}")
+
+            self.wake_event.wait(self.next_wait(next_full_scan))
+
+    def next_wait(self, next_full_scan):
+        if self.observer is None:
+            return self.poll_interval
+        if self.pending:
+            # Settling files send no further events; they are re-checked by path
+            return max(self.poll_interval, self.settle_time)
+
+        wake_at = next_full_scan
+        for path, record in self.failed_records():
+            wake_at = min(wake_at, record.get('retry_at', 0))
+        return max(0.1, wake_at - time.time())
+
+    def failed_records(self):
+        for path, record in list(self.file_index.records.items()):
+            if (record.get('status') == 'failed' and record.get('attempts', 1) < self.max_attempts
+                    and path.startswith(self.root + os.sep)):
+                yield path, record
+
+    def due_retries(self, now):
+        return [path for path, record in self.failed_records() if now >= record.get('retry_at', 0)]
+
+    def scan(self, paths=None):
+        """Check every image under the folder, or only the given absolute paths"""
+        now = time.time()
+        ready = []
+
+        if paths is not None:
+            for path in sorted(paths):
+                if self.stop_event.is_set():
+                    return
+                if not self.check(path, now, ready):
+                    # Deleted or renamed away
+                    self.pending.pop(path, None)
+            self.process_ready(ready)
+            return
+
+        seen = set()
+        for dirpath, _, filenames in os.walk(self.folder):
+            for filename in sorted(filenames):
+                if not filename.lower().endswith(self.extensions):
+                    continue
+                if self.stop_event.is_set():
+                    return
+
+                path = os.path.abspath(os.path.join(dirpath, filename))
+                if self.check(path, now, ready):
+                    seen.add(path)
+
+        for path in list(self.pending):
+            if path not in seen:
+                del self.pending[path]
+
+        self.process_ready(ready)
+
+    def check(self, path, now, ready):
+        """Queue path in ready if it is new, changed and settled, or due a retry; False if it is gone"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+
+        signature = (stat.st_size, stat.st_mtime)
+        record = self.file_index.get(path)
+        if record and (record['size'], record['mtime']) == signature:
+            # Unchanged and settled; failures are retried with backoff, also after a restart
+            if self.retry_due(record, now):
+                ready.append((path, stat, record))
+            return True
+
+        # Only a file that stopped changing between polls and is old enough is complete
+        previous = self.pending.get(path)
+        self.pending[path] = signature
+        if previous != signature or now - stat.st_mtime < self.settle_time:
+            return True
+
+        del self.pending[path]
+        ready.append((path, stat, record))
+        return True
+
+    def retry_due(self, record, now):
+        return (record.get('status') == 'failed'
+                and record.get('attempts', 1) < self.max_attempts
+                and now >= record.get('retry_at', 0))
+
+    def process_ready(self, ready):
+        # Hashing first drops touched-but-identical files before anything is decoded
+        entries = [entry for entry in (self.prepare(*item) for item in ready) if entry is not None]
+
+        for start in range(0, len(entries), self.batch_size):
+            if self.stop_event.is_set():
+                return
+            chunk = entries[start:start + self.batch_size]
+
+            if self.on_batch is None or len(chunk) == 1:
+                for entry in chunk:
+                    try:
+                        self.finish(entry, result=self.on_image(entry['path']))
+                    except Exception as e:
+                        self.finish(entry, error=str(e))
+                continue
+
+            try:
+                results, errors = self.on_batch([entry['path'] for entry in chunk])
+            except Exception as e:
+                results, errors = {}, {entry['path']: str(e) for entry in chunk}
+            for entry in chunk:
+                if entry['path'] in results:
+                    self.finish(entry, result=results[entry['path']])
+                else:
+                    self.finish(entry, error=errors.get(entry['path'], "no result returned"))
+
+    def prepare(self, path, stat, record):
+        """New index entry for a file to analyse, None if its content is already done"""
+        digest = file_hash(path)
+        same_content = record is not None and record.get('hash') == digest
+
+        # Touched or copied over with identical content: refresh the signature only
+        if same_content and record.get('status') == 'done':
+            self.file_index.update(dict(record, size=stat.st_size, mtime=stat.st_mtime))
+            return None
+
+        # New content starts a fresh attempt count
+        attempts = record.get('attempts', 1) + 1 if same_content else 1
+        return {
+            'path': path,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'hash': digest,
+            'attempts': attempts
+        }
+
+    def finish(self, entry, result=None, error=None):
+        path, attempts = entry['path'], entry['attempts']
+        if error is None:
+            entry['result'] = result
+            entry['status'] = 'done'
+        else:
+            print(f"Watch folder analysis error for {path} (attempt {attempts}/{self.max_attempts}): {error}")
+            entry['result'] = {'error': error}
+            entry['status'] = 'failed'
+            entry['retry_at'] = time.time() + self.retry_delay * 2 ** (attempts - 1)
+            if self.on_failure is not None:
+                self.on_failure(path, error, attempts, attempts < self.max_attempts)
+
+        self.file_index.update(entry)